@@ -0,0 +1,204 @@
+import argparse
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import timeit
+from typing import Callable, Dict
+from utils.cubes import CUBE_CLASSES
+from utils.game import CubieDerby
+from utils.jsontools import CompactJSONEncoder
+from utils.parallel import RaceConfig, run_simulation
+from utils.snapshot import GameState
+
+# Run from the repository root: python -m benchmarks.run_benchmarks
+BASELINES_FILE = os.path.join(os.path.dirname(__file__), 'baselines.json')
+DEFAULT_THRESHOLD = 0.10
+SEED = 2025
+
+# Cubes that fill the lineup around the one being measured, none of them has a skill that reacts to others
+FILLERS = ['Shorekeeper', 'Phoebe', 'Carlotta', 'Calcharo']
+LINEUPS = {4: ['Carlotta', 'Calcharo', 'Cantarella', 'Roccia'],
+           6: ['Jinhsi', 'Changli', 'Camellya', 'Cartethyia', 'Zani', 'Brant']}
+
+
+def time_per_call(func: Callable, repeat: int = 3) -> float:
+    # Best of `repeat` runs of at least 0.2 seconds each, in seconds per call
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def time_difference(base: Callable, func: Callable, repeat: int = 9) -> float:
+    # Seconds per call func takes over base. Both are timed back to back in every repeat, so a slow spell
+    # of the machine hits both, and the median difference is kept
+    number, _ = timeit.Timer(func).autorange()
+    differences = sorted(timeit.timeit(func, number=number) - timeit.timeit(base, number=number)
+                         for _ in range(repeat))
+    return differences[repeat // 2] / number
+
+
+def _turn_state(cube: str, scenario: str) -> GameState:
+    # The measured cube is first in the lineup and the turn order, on pad 5
+    others = [c for c in FILLERS if c != cube][:3]
+    if scenario == 'jinhsi_target':
+        others[0] = 'Jinhsi'
+    lineup = (cube,) + tuple(others)
+
+    if scenario == 'alone':
+        positions = ((5, 0), (0, 0), (0, 1), (0, 2))
+    elif scenario == 'stacked':
+        # Two cubes on top of it, the whole stack moves
+        positions = ((5, 0), (5, 1), (5, 2), (0, 0))
+    elif scenario == 'jinhsi_target':
+        # Jinhsi on pad 7, which a roll of 2 lands on, with a cube on top of her
+        positions = ((5, 0), (7, 0), (7, 1), (6, 0))
+    elif scenario == 'cantarella_passing':
+        # Cubes on the pads it passes
+        positions = ((5, 0), (6, 0), (6, 1), (7, 0))
+    else:
+        raise ValueError(scenario)
+
+    # Short, restore() clears every pad. The finish isn't checked by take_turn, so reaching it doesn't matter.
+    return GameState(lineup=lineup, num_of_pads=14, positions=positions,
+                     skill_activated=(False,) * 4, extra_moves=(0,) * 4,
+                     turn_order=(0, 1, 2, 3), next_turn=0)
+
+
+def bench_take_turn() -> Dict[str, float]:
+    # Every turn starts from the same restored state. Restoring is timed alongside for each scenario
+    # and taken off, so the figures are the turn alone.
+    results = {}
+    for cube in CUBE_CLASSES:
+        scenarios = ['alone', 'stacked']
+        if cube != 'Jinhsi':
+            scenarios.append('jinhsi_target')
+        if cube == 'Cantarella':
+            scenarios.append('cantarella_passing')
+
+        for scenario in scenarios:
+            state = _turn_state(cube, scenario)
+            game = CubieDerby(list(state.lineup), state.num_of_pads, rng=random.Random(SEED))
+            mover = game.lineup[0]
+
+            def restore():
+                game.restore(state)
+
+            def restore_and_turn():
+                game.restore(state)
+                mover.take_turn()
+
+            results[f'take_turn/{cube}/{scenario}'] = time_difference(restore, restore_and_turn)
+    return results
+
+
+def bench_play_game() -> Dict[str, float]:
+    results = {}
+    for num_of_cubes, lineup in LINEUPS.items():
+        for num_of_pads in (23, 27):
+            game = CubieDerby(lineup, num_of_pads, rng=random.Random(SEED))
+            results[f'play_game/{num_of_cubes}_cubes/{num_of_pads}_pads'] = time_per_call(game.play_game)
+    return results
+
+
+def bench_record_actions() -> Dict[str, float]:
+    results = {}
+    for record_actions in (False, True):
+        game = CubieDerby(LINEUPS[6], 27, record_actions=record_actions, rng=random.Random(SEED))
+        results[f'record_actions/{"on" if record_actions else "off"}'] = time_per_call(game.play_game)
+    results['record_actions/overhead'] = results['record_actions/on'] - results['record_actions/off']
+    return results
+
+
+def bench_json() -> Dict[str, float]:
+    game = CubieDerby(LINEUPS[6], 27, record_actions=True, rng=random.Random(SEED))
+    game.play_game()
+    data = game.get_game_data()
+
+    def write_json():
+        json.dump(data, io.StringIO(), cls=CompactJSONEncoder, indent=2)
+
+    return {'json/compact_encoder': time_per_call(write_json)}
+
+
+def bench_processes(max_processes: int | None = None,
+                    races_per_process: int = 20_000) -> Dict[str, float]:
+    # Seconds per race with 1, 2, 4... worker processes, pool start-up included
+    max_processes = max_processes or mp.cpu_count()
+    results = {}
+    processes = 1
+    while processes <= max_processes:
+        config = RaceConfig(LINEUPS[4], 27, seed=SEED)
+        number_of_simulations = races_per_process * processes
+        start = time.perf_counter()
+        run_simulation(config, number_of_simulations, chunk_size=2_000, processes=processes, show_progress=False)
+        results[f'processes/{processes}'] = (time.perf_counter() - start) / number_of_simulations
+        processes *= 2
+    return results
+
+
+BENCHMARKS = {
+    'take_turn': bench_take_turn,
+    'play_game': bench_play_game,
+    'record_actions': bench_record_actions,
+    'json': bench_json,
+    'processes': bench_processes,
+}
+
+
+def compare(results: Dict[str, float], baselines: Dict[str, float], threshold: float) -> list:
+    # Names of the benchmarks that got slower than baseline * (1 + threshold)
+    regressions = []
+    print(f'{"benchmark":<45} {"us/op":>10} {"baseline":>10} {"change":>8}')
+    for name, value in results.items():
+        baseline = baselines.get(name)
+        line = f'{name:<45} {value * 1e6:>10.2f}'
+        if baseline:
+            change = value / baseline - 1
+            line += f' {baseline * 1e6:>10.2f} {change * 100:>+7.1f}%'
+            if change > threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run_benchmarks')
+    parser.add_argument('groups', nargs='*', metavar='group',
+                        help=f'benchmark groups to run, all of them by default: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--baselines', default=BASELINES_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baselines')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='slowdown that counts as a regression, 0.1 is 10%%')
+    args = parser.parse_args(argv)
+    for group in args.groups:
+        if group not in BENCHMARKS:
+            parser.error(f'unknown benchmark group: {group}')
+
+    results = {}
+    for group in args.groups or BENCHMARKS:
+        results.update(BENCHMARKS[group]())
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, 'r') as f:
+            baselines = json.load(f)
+    regressions = compare(results, baselines, args.threshold)
+
+    if args.save_baseline:
+        baselines.update(results)
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'\nBaselines saved to {args.baselines}')
+    elif regressions:
+        print(f'\n{len(regressions)} benchmarks are more than {args.threshold * 100:.0f}% slower than the baseline')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
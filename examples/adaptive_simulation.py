@@ -0,0 +1,31 @@
+from utils.adaptive import run_adaptive_simulation
+from utils.parallel import RaceConfig
+
+HALF_WIDTH = 0.002
+SEED = 2025
+REGION = 'eu'
+CUBES = {'eu': {'Carlotta': [3, 0],
+                'Calcharo': [2, 0],
+                'Cantarella': [1, 0],
+                'Roccia': [0, 0]},
+         'na': {
+             'Roccia': [3, 0],
+             'Phoebe': [2, 0],
+             'Brant': [1, 0],
+             'Zani': [0, 0]
+         }}
+
+
+if __name__ == '__main__':
+    config = RaceConfig(cubes=list(CUBES[REGION].keys()),
+                        num_of_pads=27,
+                        starting_positions=CUBES[REGION],
+                        seed=SEED)
+    results = run_adaptive_simulation(config, half_width=HALF_WIDTH, ranking_confidence=0.99)
+
+    print(f'\nResults after {results.number_of_simulations:,} races '
+          f'({results.confidence * 100:.0f}% intervals, target {"met" if results.target_met else "not met"}):')
+    rankings = sorted(results.intervals.items(), key=lambda item: item[1][0], reverse=True)
+
+    for i, (cube, (p, low, high)) in enumerate(rankings):
+        print(f'{i + 1}. {cube} ({p * 100:4.2f}%, {low * 100:4.2f}% - {high * 100:4.2f}%)')
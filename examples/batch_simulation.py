@@ -0,0 +1,32 @@
+from utils.batch import BatchCubieDerby
+
+NUMBER_OF_SIMULATIONS = 1_000_000
+REGION = 'eu'
+CUBES = {'eu': {'Carlotta': [3, 0],
+                'Calcharo': [2, 0],
+                'Cantarella': [1, 0],
+                'Roccia': [0, 0]},
+         'na': {
+             'Roccia': [3, 0],
+             'Phoebe': [2, 0],
+             'Brant': [1, 0],
+             'Zani': [0, 0]
+         }}
+
+
+if __name__ == '__main__':
+    race = BatchCubieDerby(cubes=list(CUBES[REGION].keys()),
+                           num_of_pads=27,
+                           starting_positions=CUBES[REGION])
+    results = race.play_games(NUMBER_OF_SIMULATIONS)
+
+    print('\nResults of the simulation:')
+    simulation_rankings = sorted(results.wins.items(), key=lambda item: item[1], reverse=True)
+
+    for i, (cube, wins) in enumerate(simulation_rankings):
+        print(f'{i + 1}. {cube} ({wins / NUMBER_OF_SIMULATIONS * 100:4.2f}%)')
+
+    print('\nMost common finishing orders:')
+    standings = sorted(results.standings_counts.items(), key=lambda item: item[1], reverse=True)
+    for order, count in standings[:5]:
+        print(f'{" > ".join(order)} ({count / NUMBER_OF_SIMULATIONS * 100:4.2f}%)')
@@ -0,0 +1,34 @@
+import random
+import numpy as np
+from utils.batch import rollout
+from utils.game import CubieDerby
+
+# Takes a snapshot after every move of seeded races and carries each one on with both engines.
+# Jinhsi jumping off a stack leaves gaps in the stack orders, these lineups make sure such states are accepted.
+LINEUPS = [['Jinhsi', 'Changli', 'Camellya', 'Zani'],
+           ['Jinhsi', 'Cantarella', 'Carlotta', 'Calcharo']]
+NUMBER_OF_RACES = 200
+NUMBER_OF_ROLLOUTS = 20
+SEED = 2025
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(SEED)
+    for cubes in LINEUPS:
+        race = CubieDerby(cubes=cubes, num_of_pads=27, rng=random.Random(SEED))
+        resumed = CubieDerby(cubes=cubes, num_of_pads=27, rng=random.Random(SEED))
+        snapshots = gaps = 0
+        for _ in range(NUMBER_OF_RACES):
+            race.reset()
+            for _ in race.iter_actions():
+                state = race.snapshot()
+                if state.is_finished:
+                    break
+                snapshots += 1
+                gaps += any(stack_order >= len(cubes) for _, stack_order in state.positions)
+                results = rollout(state, NUMBER_OF_ROLLOUTS, rng)
+                assert results.num_of_games == NUMBER_OF_ROLLOUTS
+                resumed.restore(state)
+                resumed.resume_game()
+                assert resumed.is_game_finished
+        print(f'{", ".join(cubes)}: {snapshots:,} snapshots played on, {gaps:,} with gaps in a stack')
@@ -0,0 +1,34 @@
+import json
+from utils.parallel import RaceConfig
+from utils.racelog import run_logged_simulation
+
+NUMBER_OF_SIMULATIONS = 1_000_000
+SEED = 2025
+LOG_PATH = 'final_2_races'
+CUBES = {'Carlotta': [3, 0],
+         'Calcharo': [2, 0],
+         'Cantarella': [1, 0],
+         'Roccia': [0, 0]}
+
+
+if __name__ == '__main__':
+    config = RaceConfig(cubes=list(CUBES.keys()),
+                        num_of_pads=27,
+                        starting_positions=CUBES,
+                        seed=SEED)
+    log = run_logged_simulation(config, NUMBER_OF_SIMULATIONS, LOG_PATH)
+
+    # The cube that wins least often, and the first race it won
+    wins = log.results().wins
+    underdog = min(wins, key=wins.get)
+    race_number = int(log.races_won_by(underdog)[0])
+    print(f'{underdog} won {wins[underdog] / log.num_of_races * 100:4.2f}% of races, first in race {race_number}')
+
+    # A few bytes that the visualiser turns back into the full race
+    replay = log.replay(race_number)
+    with open(f'upset_{race_number}.json', 'w') as f:
+        json.dump(replay.to_dict(), f, indent=2)
+
+    game = replay.play()
+    for i, r in enumerate(game.rounds):
+        print(f'Round {i + 1}: ' + ', '.join(f'{a["cube_name"]} {a["die_rolled"]}' for a in r['actions']))
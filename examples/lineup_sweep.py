@@ -0,0 +1,23 @@
+from utils.sweep import LineupSweep, all_lineups
+
+NUMBER_OF_CUBES = 4
+NUMBER_OF_PADS = 23
+NUMBER_OF_SIMULATIONS = 100_000
+SEED = 2025
+
+
+if __name__ == '__main__':
+    sweep = LineupSweep(num_of_pads=NUMBER_OF_PADS, num_of_games=NUMBER_OF_SIMULATIONS, seed=SEED)
+    results = sweep.run(all_lineups(NUMBER_OF_CUBES))
+
+    # Average win rate of every cube over all the lineups it plays in
+    win_rates = {}
+    for lineup_results in results.values():
+        for cube, wins in lineup_results.wins.items():
+            win_rates.setdefault(cube, []).append(wins / lineup_results.num_of_games)
+
+    print(f'\nAverage win rate over {len(results)} lineups of {NUMBER_OF_CUBES} cubes:')
+    rankings = sorted(win_rates.items(), key=lambda item: sum(item[1]) / len(item[1]), reverse=True)
+    for i, (cube, rates) in enumerate(rankings):
+        print(f'{i + 1}. {cube} ({sum(rates) / len(rates) * 100:4.2f}%, '
+              f'{min(rates) * 100:4.2f}% - {max(rates) * 100:4.2f}%)')
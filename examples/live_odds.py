@@ -0,0 +1,27 @@
+import random
+import numpy as np
+from utils.batch import rollout
+from utils.game import CubieDerby
+
+CUBES = ['Carlotta', 'Calcharo', 'Cantarella', 'Roccia']
+STARTING_POSITIONS = {'Carlotta': [3, 0], 'Calcharo': [2, 0], 'Cantarella': [1, 0], 'Roccia': [0, 0]}
+NUMBER_OF_ROLLOUTS = 20_000
+SEED = 2025
+
+
+if __name__ == '__main__':
+    race = CubieDerby(cubes=CUBES, num_of_pads=27, starting_positions=STARTING_POSITIONS, rng=random.Random(SEED))
+    rng = np.random.default_rng(SEED)
+
+    # Win chances after every move of the race
+    for action in race.iter_actions():
+        state = race.snapshot()
+        header = f'Round {action["round"] + 1}, {action["cube_name"]} rolled {action["die_rolled"]}'
+        if state.is_finished:
+            print(f'{header}: {race.standings[0]} wins')
+            break
+
+        results = rollout(state, NUMBER_OF_ROLLOUTS, rng)
+        odds = ', '.join(f'{cube} {p * 100:4.1f}%' for cube, p in zip(results.cube_names,
+                                                                        results.placement_probabilities[:, 0]))
+        print(f'{header}: {odds}')
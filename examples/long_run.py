@@ -0,0 +1,27 @@
+from utils.checkpoint import CheckpointedRun
+from utils.parallel import RaceConfig
+
+# Stop it at any time and start it again to carry on, or raise the number to top up the estimate
+NUMBER_OF_SIMULATIONS = 1_000_000_000
+RESULTS_FILE = 'final_2_run.jsonl'
+# Rewritten every few seconds while it runs, use a .prom file for Prometheus
+METRICS_FILE = 'final_2_run_metrics.json'
+SEED = 2025
+CUBES = {'Carlotta': [3, 0],
+         'Calcharo': [2, 0],
+         'Cantarella': [1, 0],
+         'Roccia': [0, 0]}
+
+
+if __name__ == '__main__':
+    run = CheckpointedRun(RaceConfig(cubes=list(CUBES.keys()),
+                                     num_of_pads=27,
+                                     starting_positions=CUBES,
+                                     seed=SEED),
+                          RESULTS_FILE)
+    print(f'{run.num_of_games:,} races already in {RESULTS_FILE}')
+    results = run.run(NUMBER_OF_SIMULATIONS, metrics_path=METRICS_FILE)
+
+    print('\nResults of the simulation:')
+    for i, (cube, wins) in enumerate(sorted(results.wins.items(), key=lambda item: item[1], reverse=True)):
+        print(f'{i + 1}. {cube} ({wins / results.num_of_games * 100:4.2f}%)')
@@ -0,0 +1,15 @@
+import asyncio
+from utils.service import DEFAULT_PORT, serve
+
+# Ask it with utils.service.query_odds, e.g.
+#   query_odds({'lineup': ['Carlotta', 'Calcharo', 'Cantarella', 'Roccia'], 'num_of_pads': 27})
+# or with a race in progress: query_odds({'state': game.snapshot().to_dict()})
+HOST = '127.0.0.1'
+PORT = DEFAULT_PORT
+PROCESSES = None
+CACHE_SIZE = 1024
+
+
+if __name__ == '__main__':
+    print(f'Serving odds on http://{HOST}:{PORT}/odds')
+    asyncio.run(serve(HOST, PORT, processes=PROCESSES, cache_size=CACHE_SIZE))
@@ -0,0 +1,20 @@
+from utils.paired import run_paired_comparison
+from utils.parallel import RaceConfig
+
+# Does starting Carlotta on pad 3 instead of 2 help her, and how would Brant do in Roccia's place?
+# All three play the same die rolls, shuffles and skill chances, so far fewer races are needed than with
+# separate runs
+NUMBER_OF_SIMULATIONS = 200_000
+SEED = 2025
+BASELINE = {'Carlotta': [2, 0], 'Calcharo': [2, 1], 'Cantarella': [1, 0], 'Roccia': [0, 0]}
+CARLOTTA_AHEAD = {'Carlotta': [3, 0], 'Calcharo': [2, 1], 'Cantarella': [1, 0], 'Roccia': [0, 0]}
+WITH_BRANT = {'Carlotta': [2, 0], 'Calcharo': [2, 1], 'Cantarella': [1, 0], 'Brant': [0, 0]}
+
+
+if __name__ == '__main__':
+    configs = [RaceConfig(cubes=list(positions.keys()), num_of_pads=27, starting_positions=positions)
+               for positions in (BASELINE, CARLOTTA_AHEAD, WITH_BRANT)]
+    results = run_paired_comparison(configs, NUMBER_OF_SIMULATIONS, seed=SEED)
+    print(results.report('win'))
+    print()
+    print(results.report('place'))
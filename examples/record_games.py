@@ -0,0 +1,24 @@
+import random
+from utils.game import CubieDerby
+from utils.jsontools import append_json_lines, read_json_lines
+
+NUMBER_OF_GAMES = 100_000
+SEED = 2025
+ARCHIVE = 'recorded_games.jsonl'
+CUBES = ['Carlotta', 'Calcharo', 'Cantarella', 'Roccia']
+
+
+def recorded_games(race: CubieDerby, number_of_games: int):
+    # One game at a time, nothing is kept once it's written
+    for _ in range(number_of_games):
+        race.play_game()
+        yield race.get_game_data()
+
+
+if __name__ == '__main__':
+    race = CubieDerby(cubes=CUBES, num_of_pads=27, record_actions=True, rng=random.Random(SEED))
+    written = append_json_lines(ARCHIVE, recorded_games(race, NUMBER_OF_GAMES))
+    print(f'Appended {written:,} games to {ARCHIVE}')
+
+    longest = max(read_json_lines(ARCHIVE), key=lambda game: len(game['rounds']))
+    print(f'Longest game: {len(longest["rounds"])} rounds, won by {longest["standings"][0]}')
@@ -1,19 +1,28 @@
-from utils.game import CubieDerby
+from utils.tournament import Tournament
 
 REGION = 'eu'
 NUMBER_OF_SIMULATIONS = 1_000_000
+SEED = 2025
 CUBES = {'eu': ['Calcharo', 'Carlotta', 'Roccia', 'Cantarella']}
 
 
 if __name__ == '__main__':
+    # First round on 23 pads decides the starting stacks of the second round on 27 pads
+    tournament = Tournament(CUBES[REGION],
+                            first_round_simulations=NUMBER_OF_SIMULATIONS,
+                            second_round_simulations=NUMBER_OF_SIMULATIONS // 5,
+                            seed=SEED)
+    results = tournament.run()
 
-    rankings = {cube: 0 for cube in CUBES[REGION]}
-    # for result in results:
-    #     for cube, wins in result.items():
-    #         rankings[cube] += wins
+    print('\nMost likely first round results:')
+    first_round = sorted(results.first_round.items(), key=lambda item: item[1], reverse=True)
+    for standings, p in first_round[:5]:
+        second_round_wins = tournament.second_round_placements(standings)[:, 0]
+        favourite = results.cube_names[int(second_round_wins.argmax())]
+        print(f'{" > ".join(standings)} ({p * 100:4.2f}%), then {favourite} is the favourite')
 
-    print('\nResults of the simulation:')
-    rankings = sorted(rankings.items(), key=lambda item: item[1], reverse=True)
+    print('\nResults of the tournament:')
+    rankings = sorted(results.wins.items(), key=lambda item: item[1], reverse=True)
 
-    for i, (cube, wins) in enumerate(rankings):
-        print(f'{i + 1}. {cube} ({wins / NUMBER_OF_SIMULATIONS * 100:4.2f}%)')
+    for i, (cube, p) in enumerate(rankings):
+        print(f'{i + 1}. {cube} ({p * 100:4.2f}%)')
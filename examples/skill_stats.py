@@ -0,0 +1,11 @@
+from utils.parallel import RaceConfig, run_simulation
+
+# How often each skill fires, how long races last and where a turn spends its time
+NUMBER_OF_SIMULATIONS = 200_000
+CUBES = ['Jinhsi', 'Changli', 'Camellya', 'Cartethyia', 'Zani', 'Carlotta']
+
+
+if __name__ == '__main__':
+    results = run_simulation(RaceConfig(cubes=CUBES, num_of_pads=27, seed=2025), NUMBER_OF_SIMULATIONS,
+                             instrument=True)
+    print(results.instruments.report())
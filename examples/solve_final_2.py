@@ -0,0 +1,29 @@
+import os
+from utils.solver import ExactSolver
+from utils.sweep import ResultCache
+
+REGION = 'eu'
+CUBES = {'eu': {'Carlotta': [3, 0],
+                'Calcharo': [2, 0],
+                'Cantarella': [1, 0],
+                'Roccia': [0, 0]},
+         'na': {
+             'Roccia': [3, 0],
+             'Phoebe': [2, 0],
+             'Brant': [1, 0],
+             'Zani': [0, 0]
+         }}
+
+
+if __name__ == '__main__':
+    # Solved once, later runs read the result from the cache
+    solver = ExactSolver(cubes=list(CUBES[REGION].keys()), num_of_pads=27,
+                         cache=ResultCache(os.path.join('cache', 'solver')))
+    results = solver.solve(starting_positions=CUBES[REGION])
+
+    source = f'{solver.num_of_states} states' if solver.num_of_states else 'from the cache'
+    print(f'\nExact results ({source}):')
+    rankings = sorted(results.wins.items(), key=lambda item: item[1], reverse=True)
+
+    for i, (cube, p) in enumerate(rankings):
+        print(f'{i + 1}. {cube} ({p * 100:4.4f}%)')
@@ -0,0 +1,16 @@
+import numpy as np
+from utils.stratified import play_stratified
+
+# Every first turn order gets its share of the races instead of whatever the shuffles give it
+NUMBER_OF_SIMULATIONS = 240_000
+SEED = 2025
+CUBES = ['Carlotta', 'Calcharo', 'Cantarella', 'Roccia']
+
+
+if __name__ == '__main__':
+    results = play_stratified(CUBES, 23, NUMBER_OF_SIMULATIONS, rng=np.random.default_rng(SEED))
+    errors, plain_errors = results.win_standard_errors, results.plain_standard_errors
+    reduction = results.variance_reduction
+    for cube, p in sorted(results.win_probabilities.items(), key=lambda item: item[1], reverse=True):
+        print(f'{cube:<12} {p * 100:6.2f}% +- {errors[cube] * 100:.3f} '
+              f'(plain sampling +- {plain_errors[cube] * 100:.3f}, variance {reduction[cube]:.2f}x lower)')
@@ -0,0 +1,16 @@
+import random
+from utils.game import CubieDerby
+
+CUBES = ['Carlotta', 'Calcharo', 'Cantarella', 'Roccia']
+SEED = 2025
+
+
+if __name__ == '__main__':
+    race = CubieDerby(cubes=CUBES, num_of_pads=27, rng=random.Random(SEED))
+
+    for action in race.iter_actions():
+        skill = f' ({action["skill_activated"]})' if 'skill_activated' in action else ''
+        moved = ', '.join(f'{cube} -> {position}' for cube, (position, _) in action['moved'].items())
+        print(f'Round {action["round"] + 1}: {action["cube_name"]} rolled {action["die_rolled"]}{skill}: {moved}')
+
+    print(f'Winner: {race.standings[0]}')
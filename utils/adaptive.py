@@ -0,0 +1,110 @@
+import math
+from statistics import NormalDist
+from typing import Dict, Tuple
+from utils.parallel import ProgressReporter, RaceConfig, SimulationPool
+from utils.results import RaceResults
+from utils.rng import DEFAULT_CHUNK_SIZE
+
+
+def win_rate_intervals(wins: dict, number_of_simulations: int,
+                       confidence: float = 0.95) -> Dict[str, Tuple[float, float, float]]:
+    # Wilson score interval per cube as (win rate, lower bound, upper bound)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n = number_of_simulations
+    intervals = {}
+    for cube, w in wins.items():
+        p = w / n
+        denominator = 1 + z * z / n
+        centre = (p + z * z / (2 * n)) / denominator
+        half_width = z / denominator * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        intervals[cube] = (p, max(0.0, centre - half_width), min(1.0, centre + half_width))
+    return intervals
+
+
+def ranking_is_stable(wins: dict, number_of_simulations: int, confidence: float = 0.99) -> bool:
+    # Every cube must beat the next one in the ranking by a significant margin.
+    # The two win rates come from the same races, so the variance of their difference includes the covariance.
+    z = NormalDist().inv_cdf(confidence)
+    n = number_of_simulations
+    rates = sorted((w / n for w in wins.values()), reverse=True)
+    for p_a, p_b in zip(rates, rates[1:]):
+        variance = (p_a + p_b - (p_a - p_b) ** 2) / n
+        if variance <= 0 or (p_a - p_b) / math.sqrt(variance) < z:
+            return False
+    return True
+
+
+class AdaptiveResults:
+    def __init__(self, results: RaceResults, confidence: float, target_met: bool):
+        self.results = results
+        self.wins = results.wins
+        self.number_of_simulations = results.num_of_games
+        self.confidence = confidence
+        self.target_met = target_met
+        self.intervals = win_rate_intervals(self.wins, self.number_of_simulations, confidence)
+
+
+def run_adaptive_simulation(config: RaceConfig,
+                            half_width: float | None = 0.002,
+                            ranking_confidence: float | None = None,
+                            confidence: float = 0.95,
+                            min_simulations: int = 20_000,
+                            max_simulations: int = 10_000_000,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            processes: int | None = None,
+                            show_progress: bool = True) -> AdaptiveResults:
+    """Keeps playing batches of races until every cube's win rate interval is at most +-half_width wide
+    and/or the ranking is stable at ranking_confidence, or max_simulations is reached.
+
+    Batches are made of whole chunks with consecutive indices, so for a given seed the result only
+    depends on the targets, not on the number of processes.
+    """
+    if half_width is None and ranking_confidence is None:
+        raise ValueError('Set half_width, ranking_confidence or both')
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    results = RaceResults(config.cubes)
+    wins = results.wins
+    number_of_simulations = 0
+    next_chunk_index = 0
+    batch_size = min_simulations
+
+    def target_met() -> bool:
+        if half_width is not None:
+            intervals = win_rate_intervals(wins, number_of_simulations, confidence)
+            if any(max(p - low, high - p) > half_width for p, low, high in intervals.values()):
+                return False
+        if ranking_confidence is not None and not ranking_is_stable(wins, number_of_simulations,
+                                                                    ranking_confidence):
+            return False
+        return True
+
+    with SimulationPool(config, processes) as pool:
+        while True:
+            batch_size = min(math.ceil(batch_size / chunk_size) * chunk_size,
+                             max_simulations - number_of_simulations)
+            num_of_chunks = math.ceil(batch_size / chunk_size)
+            chunks = [(next_chunk_index + i, min(chunk_size, batch_size - i * chunk_size))
+                      for i in range(num_of_chunks)]
+            next_chunk_index += num_of_chunks
+
+            progress = ProgressReporter(batch_size) if show_progress else None
+            for _, simulation_count, chunk_results in pool.imap_chunks(chunks):
+                results.merge(chunk_results)
+                if progress is not None:
+                    progress.update(simulation_count)
+            wins, number_of_simulations = results.wins, results.num_of_games
+
+            if target_met():
+                return AdaptiveResults(results, confidence, True)
+            if number_of_simulations >= max_simulations:
+                return AdaptiveResults(results, confidence, False)
+
+            # Estimate how many races the widest interval still needs
+            batch_size = chunk_size
+            if half_width is not None:
+                variance = max(w / number_of_simulations * (1 - w / number_of_simulations) for w in wins.values())
+                required = math.ceil(z * z * variance / (half_width * half_width))
+                batch_size = max(batch_size, required - number_of_simulations)
+            if ranking_confidence is not None:
+                batch_size = max(batch_size, number_of_simulations // 2)
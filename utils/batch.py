@@ -0,0 +1,285 @@
+from typing import List
+import numpy as np
+from utils.results import RaceResults
+from utils.skills import BEFORE_MOVE, FIRST_TO_MOVE, LAST_PLACE, LAST_TO_MOVE, REPEAT_ROLL, SKILLS
+from utils.snapshot import GameState
+
+# Sort keys are built as `major * ORDER_SCALE + stack_order`, pads and stack orders stay well below this
+ORDER_SCALE = 1 << 10
+NOT_MOVING = np.iinfo(np.int32).max
+
+
+def validate_race(cubes: List[str], num_of_pads: int, starting_positions: dict | None = None) -> None:
+    # Raises ValueError for races the engines can't play: they would never end or give meaningless odds
+    if len(cubes) < 2 or len(set(cubes)) != len(cubes):
+        raise ValueError('A race needs at least 2 different cubes')
+    for cube in cubes:
+        if cube not in SKILLS:
+            raise ValueError(f'Unknown cube: {cube}')
+    if not 0 < num_of_pads < ORDER_SCALE // 2:
+        raise ValueError(f'num_of_pads has to be between 1 and {ORDER_SCALE // 2 - 1}')
+    if starting_positions is not None:
+        places = set()
+        for cube in cubes:
+            position, stack_order = starting_positions[cube]
+            if not (0 <= position < num_of_pads and 0 <= stack_order < len(cubes)):
+                raise ValueError(f'Starting position of {cube} is off the track: {[position, stack_order]}')
+            places.add((position, stack_order))
+        if len(places) != len(cubes):
+            raise ValueError('Two cubes start in the same place')
+
+
+class BatchCubieDerby:
+    """Plays many races in lockstep, every cube turn is applied to all unfinished races at once.
+
+    Reproduces the rules of the `Cube` subclasses in `utils.cubes`, with the numbers from `utils.skills.SKILLS`,
+    but only the final standings are kept.
+    """
+
+    def __init__(self,
+                 cubes: List[str],
+                 num_of_pads: int,
+                 starting_positions: dict = None,
+                 randomize_order: bool = True,
+                 rng: np.random.Generator | None = None):
+        validate_race(cubes, num_of_pads, starting_positions)
+
+        self.cube_names = list(cubes)
+        self.num_of_pads = num_of_pads
+        self.starting_positions = starting_positions
+        self.randomize_order = randomize_order
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.num_of_cubes = len(self.cube_names)
+
+        # Die faces per cube, padded to three columns
+        self._faces = np.zeros((self.num_of_cubes, 3), dtype=np.int32)
+        self._num_of_faces = np.zeros(self.num_of_cubes, dtype=np.int32)
+        for i, cube in enumerate(self.cube_names):
+            faces = SKILLS[cube].die_faces
+            self._faces[i, :len(faces)] = faces
+            self._num_of_faces[i] = len(faces)
+
+        # Index of each skill cube in the lineup, -1 if it isn't playing
+        self._idx = {cube: (self.cube_names.index(cube) if cube in self.cube_names else -1)
+                     for cube in SKILLS}
+        # BEFORE_MOVE skills of the lineup as (cube index, condition, chance, bonus, repeats the roll),
+        # in the order of SKILLS, which is also the order their chances are drawn in
+        self._before_move = [(self._idx[cube], skill.condition, skill.chance, skill.bonus, skill.effect == REPEAT_ROLL)
+                             for cube, skill in SKILLS.items() if skill.phase == BEFORE_MOVE and self._idx[cube] >= 0]
+
+    def play_games(self, num_of_games: int, batch_size: int = 50_000,
+                   state: GameState | None = None) -> RaceResults:
+        # Races from the start, or continuations of a race from a snapshot of it when state is given
+        if state is not None:
+            if state.lineup != tuple(self.cube_names) or state.num_of_pads != self.num_of_pads:
+                raise ValueError('The state is from a race with a different lineup or track')
+            if state.is_finished:
+                raise ValueError('The race is already over')
+            state.validate()
+
+        results = RaceResults(self.cube_names)
+        while results.num_of_games < num_of_games:
+            results.add_standings(self._play_batch(min(batch_size, num_of_games - results.num_of_games), state))
+        return results
+
+    def play_turn_orders(self, turn_orders: np.ndarray, batch_size: int = 50_000) -> np.ndarray:
+        """Plays one race per row of turn_orders[race, turn] -> cube index, the order of the first round.
+
+        Returns standings[race, place] -> cube index in the same order. Used to sample every first turn
+        order on purpose instead of at random, see utils.stratified.
+        """
+        standings = np.empty((len(turn_orders), self.num_of_cubes), dtype=np.int64)
+        for start in range(0, len(turn_orders), batch_size):
+            batch = np.ascontiguousarray(turn_orders[start:start + batch_size].T, dtype=np.int32)
+            standings[start:start + batch.shape[1]] = self._play_batch(batch.shape[1], turn_order=batch)
+        return standings
+
+    def _initial_state(self, num_of_games: int, turn_order: np.ndarray | None = None):
+        # All per-race arrays are laid out as (cube, race) so reductions over the cubes stay vectorised
+        n, num_of_cubes = num_of_games, self.num_of_cubes
+        cols = np.arange(n)
+
+        if turn_order is not None:
+            turn_order = turn_order.copy()
+        elif self.randomize_order:
+            turn_order = np.argsort(self.rng.random((num_of_cubes, n)), axis=0).astype(np.int32)
+        else:
+            turn_order = np.repeat(np.arange(num_of_cubes, dtype=np.int32)[:, None], n, axis=1)
+
+        positions = np.zeros((num_of_cubes, n), dtype=np.int32)
+        stack_orders = np.zeros((num_of_cubes, n), dtype=np.int32)
+        if self.starting_positions is not None:
+            for i, cube in enumerate(self.cube_names):
+                positions[i], stack_orders[i] = self.starting_positions[cube]
+        else:
+            # Stack everyone on the starting pad, the first to move is on top
+            for turn in range(num_of_cubes):
+                stack_orders[turn_order[turn], cols] = num_of_cubes - 1 - turn
+
+        return positions, stack_orders, turn_order
+
+    def _snapshot_state(self, state: GameState, num_of_games: int):
+        def repeat(values, dtype):
+            return np.repeat(np.array(values, dtype=dtype)[:, None], num_of_games, axis=1)
+
+        positions = repeat([position for position, _ in state.positions], np.int32)
+        stack_orders = repeat([stack_order for _, stack_order in state.positions], np.int32)
+        turn_order = repeat(state.turn_order, np.int32)
+        return positions, stack_orders, turn_order
+
+    def _play_batch(self, num_of_games: int, state: GameState | None = None,
+                    turn_order: np.ndarray | None = None) -> np.ndarray:
+        rng = self.rng
+        idx = self._idx
+        skill = SKILLS
+        num_of_cubes, last_pad = self.num_of_cubes, self.num_of_pads - 1
+        cube_ids = np.arange(num_of_cubes, dtype=np.int32)[:, None]
+
+        standings = np.zeros((num_of_games, num_of_cubes), dtype=np.int64)
+
+        # Skill state, one entry per race
+        zani_pending = np.zeros(num_of_games, dtype=bool)
+        cartethyia_active = np.zeros(num_of_games, dtype=bool)
+        cantarella_used = np.zeros(num_of_games, dtype=bool)
+        changli_last = np.zeros(num_of_games, dtype=bool)
+
+        if state is None:
+            positions, stack_orders, turn_order = self._initial_state(num_of_games, turn_order)
+            first_turn = 0
+        else:
+            # Carry on from the snapshot, starting with what's left of its round
+            positions, stack_orders, turn_order = self._snapshot_state(state, num_of_games)
+            first_turn = state.next_turn
+            for cube, flags in (('Zani', zani_pending), ('Cartethyia', cartethyia_active),
+                                ('Cantarella', cantarella_used)):
+                if idx[cube] >= 0:
+                    flags[:] = state.skill_activated[idx[cube]]
+            changli_last[:] = state.moves_last_next_round is not None
+
+        # Races still running, as indices into the original batch
+        race_ids = np.arange(num_of_games)
+
+        while len(race_ids) > 0:
+            live = np.ones(len(race_ids), dtype=bool)
+
+            for turn in range(first_turn, num_of_cubes):
+                r = np.flatnonzero(live)
+                if len(r) == 0:
+                    break
+                n = len(r)
+                cols = np.arange(n)
+
+                pos = positions[:, r]
+                order = stack_orders[:, r]
+                mover = turn_order[turn, r]
+                mover_pos = pos[mover, cols]
+                mover_order = order[mover, cols]
+                is_cube = {cube: mover == i for cube, i in idx.items() if i >= 0}
+
+                # Roll the die
+                num_of_faces = self._num_of_faces[mover]
+                die = self._faces[mover, (rng.random(n) * num_of_faces).astype(np.int32)]
+
+                # Skills applied before moving
+                extra = np.zeros(n, dtype=np.int32)
+                for i, condition, chance, bonus, repeat_roll in self._before_move:
+                    if (condition == FIRST_TO_MOVE and turn != 0) or (condition == LAST_TO_MOVE
+                                                                      and turn != num_of_cubes - 1):
+                        continue
+                    applies = mover == i
+                    if condition == LAST_PLACE:
+                        applies &= np.argmin(pos * ORDER_SCALE + order, axis=0) == mover
+                    if chance < 1.0:
+                        applies &= rng.random(n) < chance
+                    extra[applies] = die[applies] if repeat_roll else bonus
+                if 'Zani' in is_cube:
+                    extra[is_cube['Zani'] & zani_pending[r]] = skill['Zani'].bonus
+                if 'Cartethyia' in is_cube:
+                    extra[is_cube['Cartethyia'] & cartethyia_active[r]] = skill['Cartethyia'].bonus
+
+                new_pos = np.minimum(mover_pos + die + extra, last_pad)
+
+                # Find all cubes in the same stack that will move together
+                on_mover_pad = pos == mover_pos
+                moving = on_mover_pad & (order >= mover_order)
+
+                if 'Camellya' in is_cube:
+                    stack_size = on_mover_pad.sum(axis=0)
+                    alone = is_cube['Camellya'] & (stack_size > 1) & (rng.random(n) < skill['Camellya'].chance)
+                    new_pos[alone] += stack_size[alone] - 1
+                    order -= alone & on_mover_pad & (order > mover_order)
+                    moving &= ~alone | (cube_ids == mover)
+
+                # Stack orders of the moving cubes are assigned by this key, lowest at the bottom.
+                # Cubes passed by Cantarella go below her stack, the furthest ahead first.
+                move_key = ORDER_SCALE * ORDER_SCALE + order
+                if 'Cantarella' in is_cube:
+                    carrying = is_cube['Cantarella'] & ~cantarella_used[r]
+                    passed = carrying & (pos > mover_pos) & (pos < new_pos)
+                    cantarella_used[r[passed.any(axis=0)]] = True
+                    move_key = np.where(passed, (ORDER_SCALE - pos) * ORDER_SCALE + order, move_key)
+                    moving |= passed
+
+                target = (pos == new_pos) & ~moving
+
+                # Jinhsi jumps to the top of the arriving stack
+                if 'Jinhsi' in is_cube:
+                    j = idx['Jinhsi']
+                    jumps = target[j] & (rng.random(n) < skill['Jinhsi'].chance)
+                    target[j] &= ~jumps
+                    moving[j] |= jumps
+                    move_key[j] = np.where(jumps, 2 * ORDER_SCALE * ORDER_SCALE, move_key[j])
+
+                base_order = np.where(target, order + 1, 0).max(axis=0)
+                move_key = np.where(moving, move_key, NOT_MOVING)
+                rank = np.zeros_like(order)
+                for cube_idx in range(num_of_cubes):
+                    rank += move_key[cube_idx] < move_key
+                pos = np.where(moving, new_pos, pos)
+                order = np.where(moving, base_order + rank, order)
+
+                # Skills applied after moving
+                if 'Changli' in is_cube:
+                    moves_last = is_cube['Changli'] & (base_order > 0) & (rng.random(n) < skill['Changli'].chance)
+                    changli_last[r[moves_last]] = True
+                if 'Zani' in is_cube:
+                    z = is_cube['Zani']
+                    num_moving = moving[:, z].sum(axis=0)
+                    zani_pending[r[z]] = (num_moving > 1) & (rng.random(len(num_moving)) < skill['Zani'].chance)
+                if 'Cartethyia' in is_cube:
+                    c = idx['Cartethyia']
+                    triggers = (is_cube['Cartethyia'] & ~cartethyia_active[r] & (order[c] == 0)
+                                & (rng.random(n) < skill['Cartethyia'].chance) & (pos[c] == pos.min(axis=0)))
+                    cartethyia_active[r[triggers]] = True
+
+                positions[:, r] = pos
+                stack_orders[:, r] = order
+
+                # Check for the winners
+                finished = pos[mover, cols] + 1 >= self.num_of_pads
+                if finished.any():
+                    done = r[finished]
+                    standings[race_ids[done]] = np.argsort(
+                        -(positions[:, done] * ORDER_SCALE + stack_orders[:, done]), axis=0).T
+                    live[done] = False
+
+            # Drop finished races and shuffle the turn order for the next round
+            race_ids = race_ids[live]
+            positions, stack_orders = positions[:, live], stack_orders[:, live]
+            zani_pending, cartethyia_active = zani_pending[live], cartethyia_active[live]
+            cantarella_used, changli_last = cantarella_used[live], changli_last[live]
+
+            shuffle_keys = rng.random((num_of_cubes, len(race_ids)))
+            if idx['Changli'] >= 0:
+                shuffle_keys[idx['Changli'], changli_last] = 2.0
+            turn_order = np.argsort(shuffle_keys, axis=0).astype(np.int32)
+            changli_last = np.zeros(len(race_ids), dtype=bool)
+            first_turn = 0
+
+        return standings
+
+
+def rollout(state: GameState, num_of_games: int = 20_000, rng: np.random.Generator | None = None) -> RaceResults:
+    # Finishing orders of num_of_games continuations of a race from a snapshot of it
+    race = BatchCubieDerby(list(state.lineup), state.num_of_pads, rng=rng)
+    return race.play_games(num_of_games, state=state)
@@ -0,0 +1,46 @@
+from typing import List
+
+
+class Board:
+    """Keeps an ordered stack of cubes per pad, bottom cube first.
+
+    Cubes never move backwards, so the lowest occupied pad only ever moves forward and the last cube
+    in the standings is found without sorting.
+    """
+
+    def __init__(self, num_of_pads: int, num_of_cubes: int):
+        # Camellya can overshoot the last pad by up to one pad per cube she leaves behind
+        self.pads: List[List] = [[] for _ in range(num_of_pads + num_of_cubes)]
+        self.lowest_position = 0
+
+    def place_cubes(self, cubes: List) -> None:
+        for pad in self.pads:
+            pad.clear()
+        for cube in sorted(cubes, key=lambda c: c.stack_order):
+            self.pads[cube.position].append(cube)
+        self.lowest_position = min(c.position for c in cubes)
+
+    def get_stack(self, position: int) -> List:
+        return list(self.pads[position])
+
+    def move_stack(self, moving_stack: List, target_position: int, max_stack_order: int) -> None:
+        # moving_stack is ordered bottom to top and lands on top of whatever is on the target pad
+        target = self.pads[target_position]
+        for i, c in enumerate(moving_stack):
+            self.pads[c.position].remove(c)
+            c.position = target_position
+            c.stack_order = max_stack_order + i
+            target.append(c)
+
+        while not self.pads[self.lowest_position]:
+            self.lowest_position += 1
+
+    def last_cube(self):
+        return self.pads[self.lowest_position][0]
+
+    def cubes_between(self, start: int, end: int) -> List:
+        # All cubes strictly between the two pads, furthest ahead first, each pad bottom to top
+        return [c for position in range(end - 1, start, -1) for c in self.pads[position]]
+
+    def standings(self) -> List:
+        return [c for pad in reversed(self.pads) for c in reversed(pad)]
@@ -0,0 +1,127 @@
+import json
+import os
+import sys
+from dataclasses import asdict
+from typing import Dict
+from utils.cubes import ENGINE_VERSION
+from utils.metrics import MetricsExporter
+from utils.game import CubieDerby
+from utils.parallel import ProgressReporter, RaceConfig, SimulationPool, play_chunk, run_monitored_chunk
+from utils.results import RaceResults
+from utils.rng import DEFAULT_CHUNK_SIZE, split_into_chunks
+
+
+class CheckpointedRun:
+    """A long simulation that keeps every finished chunk in a results file, so it can stop and carry on.
+
+    The file is JSON Lines: a header with the config, then one line per finished chunk with its index
+    (which is also its RNG stream), number of races and finishing order counts. Lines are flushed to disk as
+    chunks finish, a crash loses at most the chunks still running. Running again with the same or a bigger
+    number of races only plays the chunks that are missing, so an estimate can be topped up later.
+    Chunks are split as in run_simulation, so the results are the same as playing that many races in one go.
+    A short last chunk that is topped up is played again from the start of its stream, its new line
+    replaces the old one. `run` returns exactly the races asked for, `results` everything in the file.
+    """
+
+    def __init__(self, config: RaceConfig, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.config = config
+        self.path = path
+        self.chunk_size = chunk_size
+        self.header = {'config': asdict(config), 'chunk_size': chunk_size, 'engine_version': ENGINE_VERSION}
+        # chunk_index -> results of that chunk
+        self.chunks: Dict[int, RaceResults] = {}
+        self._load()
+
+    def _load(self):
+        # Sets self.chunks from the file, and remembers where its last complete line ends
+        self._valid_size = 0
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        if not lines or not lines[0].endswith(b'\n'):
+            return
+        header = json.loads(lines[0])
+        if header != json.loads(json.dumps(self.header)):
+            raise ValueError(f'{self.path} holds a different run: {header}')
+        self._valid_size = len(lines[0])
+
+        for line in lines[1:]:
+            if not line.endswith(b'\n'):
+                # Cut short by a crash, that chunk is played again
+                break
+            entry = json.loads(line)
+            self.chunks[entry['chunk']] = RaceResults.from_dict(entry['results'])
+            self._valid_size += len(line)
+
+    @property
+    def results(self) -> RaceResults:
+        results = RaceResults(self.config.cubes)
+        for chunk_index in sorted(self.chunks):
+            results.merge(self.chunks[chunk_index])
+        return results
+
+    @property
+    def num_of_games(self) -> int:
+        return sum(results.num_of_games for results in self.chunks.values())
+
+    def run(self, number_of_simulations: int, processes: int | None = None,
+            show_progress: bool = True, metrics_path: str | None = None) -> RaceResults:
+        # metrics_path: file to keep live metrics of the chunks being played in, see MetricsExporter
+        chunks = split_into_chunks(number_of_simulations, self.chunk_size)
+        missing = [(i, count) for i, count in chunks if i not in self.chunks or self.chunks[i].num_of_games < count]
+        if missing:
+            self._play(missing, processes, show_progress, metrics_path)
+
+        results = RaceResults(self.config.cubes)
+        for chunk_index, count in chunks:
+            if self.chunks[chunk_index].num_of_games == count:
+                results.merge(self.chunks[chunk_index])
+            else:
+                # Fewer races than the file holds for this chunk, its start is played again and not saved
+                race = CubieDerby(self.config.cubes, self.config.num_of_pads, self.config.starting_positions,
+                                  self.config.randomize_order)
+                results.merge(play_chunk(race, self.config.seed, chunk_index, count))
+        return results
+
+    def _play(self, chunks, processes, show_progress, metrics_path):
+        total = sum(count for _, count in chunks)
+        progress = ProgressReporter(total) if show_progress else None
+        metrics = None
+        if metrics_path is not None:
+            metrics = MetricsExporter(metrics_path, total, self.config.cubes)
+            # Win rates include the chunks already in the file, short chunks that are played again aside
+            metrics.results = RaceResults(self.config.cubes)
+            replayed = {i for i, _ in chunks}
+            for chunk_index, chunk_results in self.chunks.items():
+                if chunk_index not in replayed:
+                    metrics.results.merge(chunk_results)
+
+        with open(self.path, 'a') as f:
+            # Drop anything after the last complete line, a partial line would break the next one
+            f.truncate(self._valid_size)
+            if self._valid_size == 0:
+                self._write_line(f, json.dumps(self.header))
+
+            try:
+                with SimulationPool(self.config, processes) as pool:
+                    for chunk_index, simulation_count, chunk_results, worker in pool.imap_chunks(
+                            chunks, run=run_monitored_chunk):
+                        self._write_line(f, json.dumps({'chunk': chunk_index, 'count': simulation_count,
+                                                        'results': chunk_results.to_dict()}))
+                        self.chunks[chunk_index] = chunk_results
+                        if progress is not None:
+                            progress.update(simulation_count)
+                        if metrics is not None:
+                            metrics.results.merge(chunk_results)
+                            metrics.update(simulation_count, worker)
+            except KeyboardInterrupt:
+                sys.stderr.write(f'\nStopped, {len(self.chunks)} chunks are saved in {self.path}\n')
+                raise
+
+    def _write_line(self, f, line: str):
+        f.write(line + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+        self._valid_size += len(line) + 1
@@ -1,57 +1,131 @@
-from dataclasses import dataclass
-from typing import List
-import random
+import time
+from typing import List, Tuple
+from utils.skills import BEFORE_MOVE, FIRST_TO_MOVE, LAST_PLACE, LAST_TO_MOVE, REPEAT_ROLL, SKILLS, Skill
+
+# Bump whenever a rule changes the outcome of races, cached results of older versions are then ignored
+ENGINE_VERSION = 1
+
+# Conditions of BEFORE_MOVE skills, picked once per cube class and called as methods
+SKILL_CONDITIONS = {
+    FIRST_TO_MOVE: lambda cube: cube is cube.game.cubes[0],
+    LAST_TO_MOVE: lambda cube: cube is cube.game.cubes[-1],
+    LAST_PLACE: lambda cube: cube is cube.game.board.last_cube(),
+}
 
 
-@dataclass
 class Cube:
     name: str
+    # Filled in from the cube's entry in utils.skills.SKILLS
+    skill: Skill
     skill_effect: str
-    position: int = 0
-    stack_order: int = 0
-    skill_activated: bool = False
-    die_rolled: int = 0
-    extra_moves: int = 0
-    last_action: dict | None = None
+    die_faces: tuple = (1, 2, 3)
+    skill_chance: float = 1.0
+    skill_bonus: int = 0
+    has_skill_before_move: bool = False
+    _skill_condition = None
+    _repeat_roll: bool = False
+
+    __slots__ = ('game', 'position', 'stack_order', 'skill_activated', 'die_rolled', 'extra_moves', 'last_action',
+                 'die_rng', 'skill_rng')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.skill = skill = SKILLS[cls.name]
+        cls.skill_effect = skill.description
+        cls.die_faces, cls.skill_chance, cls.skill_bonus = skill.die_faces, skill.chance, skill.bonus
+        if skill.phase == BEFORE_MOVE:
+            cls._skill_condition = SKILL_CONDITIONS.get(skill.condition)
+            cls._repeat_roll = skill.effect == REPEAT_ROLL
+        # take_turn skips the hook for cubes that don't have one
+        cls.has_skill_before_move = (skill.phase == BEFORE_MOVE
+                                     or cls._apply_skill_before_move is not Cube._apply_skill_before_move)
 
     def __init__(self, game):
         self.game = game
+        # Where die rolls and skill chances are drawn from, set by the game (see CubieDerby.rng)
+        self.die_rng = self.skill_rng = game.rng
+        self.reset()
+
+    def reset(self) -> None:
+        self.position: int = 0
+        self.stack_order: int = 0
+        self.skill_activated: bool = False
+        self.die_rolled: int = 0
+        self.extra_moves: int = 0
+        self.last_action: dict | None = None
 
     def take_turn(self) -> None | dict:
-        self.last_action = {'cube_name': self.name}
+        # Actions are only built when the game is recording or streaming them
+        self.last_action = {'cube_name': self.name} if self.game.build_actions else None
 
         self.roll_die()
-        self._apply_skill_before_move()
+        if self.has_skill_before_move:
+            self._apply_skill_before_move()
+        moving_stack, new_position = self._find_moving_stack()
+        self._move_stack_to_position(moving_stack, new_position)
+        self._apply_skill_after_move()
 
-        # Find all cubes in the same stack that will move together
-        new_position = min(self.position + self.die_rolled + self.extra_moves, self.game.num_of_pads - 1)
-        stack = self.game.get_stack_at_position(self.position)
-        moving_stack = sorted([c for c in stack if c.stack_order >= self.stack_order],
-                              key=lambda x: x.stack_order)
+        return self.last_action
+
+    def take_turn_timed(self, instruments) -> None | dict:
+        # The steps of take_turn, each one timed into instruments (see utils.instrumentation)
+        clock = time.perf_counter
+        start = clock()
+        self.last_action = {'cube_name': self.name} if self.game.build_actions else None
+
+        self.roll_die()
+        rolled = clock()
+        if self.has_skill_before_move:
+            self._apply_skill_before_move()
+        skill_before = clock()
+        moving_stack, new_position = self._find_moving_stack()
+        looked_up = clock()
 
         self._move_stack_to_position(moving_stack, new_position)
+        moved = clock()
 
         self._apply_skill_after_move()
+        end = clock()
 
+        for phase, seconds in (('roll', rolled - start), ('skill_before_move', skill_before - rolled),
+                               ('stack_lookup', looked_up - skill_before), ('move', moved - looked_up),
+                               ('skill_after_move', end - moved), ('turn', end - start)):
+            instruments.add_time(phase, seconds)
         return self.last_action
 
     def roll_die(self) -> None:
-        self.die_rolled = random.randint(1, 3)
-        self.last_action['die_rolled'] = self.die_rolled
+        self.die_rolled = self.die_rng.choice(self.die_faces)
+        if self.last_action is not None:
+            self.last_action['die_rolled'] = self.die_rolled
+
+    def _record_skill(self) -> None:
+        if self.last_action is not None:
+            self.last_action['skill_activated'] = self.skill_effect
+        if self.game.instruments is not None:
+            self.game.instruments.skill_triggered(self.name)
 
     def _apply_skill_before_move(self) -> None:
-        pass
+        # The cube's BEFORE_MOVE skill from SKILLS, only called for cubes that have one
+        if self._skill_condition is not None and not self._skill_condition():
+            return
+        if self.skill_chance < 1.0 and self.skill_rng.random() >= self.skill_chance:
+            return
+        self.extra_moves = self.die_rolled if self._repeat_roll else self.skill_bonus
+        self._record_skill()
+
+    def _find_moving_stack(self) -> Tuple[List['Cube'], int]:
+        # The cube and everything above it moves together
+        new_position = min(self.position + self.die_rolled + self.extra_moves, self.game.num_of_pads - 1)
+        stack = self.game.get_stack_at_position(self.position)
+        return stack[stack.index(self):], new_position
 
     def _move_stack_to_position(self, moving_stack: List['Cube'], target_position: int):
         target_stack = self.game.get_stack_at_position(target_position)
-        for c in target_stack:
-            if isinstance(c, Jinhsi):
-                c.apply_jinhsi_skill(moving_stack, target_stack)
-                break
+        jinhsi = self.game.jinhsi
+        if jinhsi is not None and jinhsi.position == target_position:
+            jinhsi.apply_jinhsi_skill(moving_stack, target_stack)
         max_stack_order = (max(c.stack_order for c in target_stack) + 1) if target_stack else 0
-        for i, c in enumerate(moving_stack):
-            c.position = target_position
-            c.stack_order = max_stack_order + i
+        self.game.board.move_stack(moving_stack, target_position, max_stack_order)
 
     def _apply_skill_after_move(self) -> None:
         self.extra_moves = 0
@@ -64,46 +138,9 @@ class Cube:
         return self.name
 
 
-class Roccia(Cube):
-    name = 'Roccia'
-    skill_effect = 'Last to move (+2)'
-
-    def _apply_skill_before_move(self) -> None:
-        if self == self.game.cubes[-1]:
-            self.skill_activated = True
-            self.extra_moves = 2
-            self.last_action['skill_activated'] = self.skill_effect
-
-
-class Brant(Cube):
-    name = 'Brant'
-    skill_effect = 'First to move (+2)'
-
-    def _apply_skill_before_move(self) -> None:
-        if self == self.game.cubes[0]:
-            self.skill_activated = True
-            self.extra_moves = 2
-            self.last_action['skill_activated'] = self.skill_effect
-
-
-class Phoebe(Cube):
-    name = 'Phoebe'
-    skill_effect = '50% chance for extra (+1)'
-
-    def _apply_skill_before_move(self) -> None:
-        if random.random() < 0.5:
-            self.skill_activated = True
-            self.extra_moves = 1
-            self.last_action['skill_activated'] = self.skill_effect
-
-
 class Zani(Cube):
     name = 'Zani'
-    skill_effect = 'Stacked move, next turn (+2)'
-
-    def roll_die(self) -> None:
-        self.die_rolled = random.choice([1, 3])
-        self.last_action['die_rolled'] = self.die_rolled
+    __slots__ = ()
 
     def _move_stack_to_position(self, moving_stack, target_position) -> None:
         if self.skill_activated:
@@ -112,10 +149,10 @@ class Zani(Cube):
 
         super()._move_stack_to_position(moving_stack, target_position)
 
-        if len(moving_stack) > 1 and random.random() < 0.4:
+        if len(moving_stack) > 1 and self.skill_rng.random() < self.skill_chance:
             self.skill_activated = True
-            self.extra_moves = 2
-            self.last_action['skill_activated'] = self.skill_effect
+            self.extra_moves = self.skill_bonus
+            self._record_skill()
 
     def _apply_skill_after_move(self) -> None:
         pass
@@ -123,37 +160,28 @@ class Zani(Cube):
 
 class Cartethyia(Cube):
     name = 'Cartethyia'
-    skill_effect = 'Ranked last, permanent (+2)'
+    __slots__ = ()
 
     def _apply_skill_after_move(self) -> None:
-        if not self.skill_activated and self.stack_order == 0 and random.random() < 0.6:
-            sorted_cubes = sorted(self.game.cubes, key=lambda x: x.position)
-            if self.position == sorted_cubes[0].position:
+        if not self.skill_activated and self.stack_order == 0 and self.skill_rng.random() < self.skill_chance:
+            if self.position == self.game.board.lowest_position:
                 self.skill_activated = True
-                self.extra_moves = 2
-                self.last_action['skill_activated'] = self.skill_effect
-
-    def _apply_skill_before_move(self) -> None:
-        pass
+                self.extra_moves = self.skill_bonus
+                self._record_skill()
 
 
 class Cantarella(Cube):
     name = 'Cantarella'
-    skill_effect = 'Carrying passed cubes forward'
+    __slots__ = ()
 
     def _move_stack_to_position(self, moving_stack, target_position) -> None:
         if not self.skill_activated:
-            # Check if she passed any cubes
-            passed_cubes = [c for c in self.game.cubes
-                            if self.position < c.position < target_position]
+            # Check if she passed any cubes, the furthest ahead end up at the bottom
+            passed_cubes = self.game.board.cubes_between(self.position, target_position)
             if len(passed_cubes) > 0:
-                passed_cubes = sorted(passed_cubes, key=lambda c: (-c.position, c.stack_order))
-                for i, c in enumerate(passed_cubes):
-                    c.position = self.position
-
                 moving_stack = passed_cubes + moving_stack
                 self.skill_activated = True
-                self.last_action['skill_activated'] = self.skill_effect
+                self._record_skill()
 
         super()._move_stack_to_position(moving_stack, target_position)
 
@@ -163,111 +191,65 @@ class Cantarella(Cube):
 
 class Jinhsi(Cube):
     name = 'Jinhsi'
-    skill_effect = 'Cubes above, 40% chance to move to top'
+    __slots__ = ()
 
     def apply_jinhsi_skill(self, moving_stack: List['Cube'], target_stack: List['Cube']):
-        if random.random() < 0.4:
+        instruments = self.game.instruments
+        if instruments is not None:
+            # Its chances come from cubes landing on its pad, not from its own turns
+            instruments.skill_chance(self.name)
+        if self.skill_rng.random() < self.skill_chance:
             target_stack.remove(self)
             moving_stack.append(self)
+            # Not _record_skill, this happens on another cube's turn
+            if instruments is not None:
+                instruments.skill_triggered(self.name)
 
 
 class Changli(Cube):
     name = 'Changli'
-    skill_effect = 'Cubes below, 65% chance to move last next turn'
+    __slots__ = ()
 
     def _move_stack_to_position(self, moving_stack: List['Cube'], target_position: int):
         target_stack = self.game.get_stack_at_position(target_position)
 
         # I don't know which skill triggers first, Changli's or Jinhsi's
-        for c in target_stack:
-            if isinstance(c, Jinhsi):
-                c.apply_jinhsi_skill(moving_stack, target_stack)
-                break
+        jinhsi = self.game.jinhsi
+        if jinhsi is not None and jinhsi.position == target_position:
+            jinhsi.apply_jinhsi_skill(moving_stack, target_stack)
 
         max_stack_order = (max(c.stack_order for c in target_stack) + 1) if target_stack else 0
 
-        if max_stack_order > 0 and random.random() < 0.65:
-            self.last_action['skill_activated'] = self.skill_effect
-
-        for i, c in enumerate(moving_stack):
-            c.position = target_position
-            c.stack_order = max_stack_order + i
-
-
-class Calcharo(Cube):
-    name = 'Calcharo'
-    skill_effect = 'Last place (+3)'
-
-    def _apply_skill_before_move(self) -> None:
-        self.game.determine_standings()
-        if self == self.game.standings[-1]:
-            self.extra_moves = 3
-            self.last_action['skill_activated'] = self.skill_effect
-
-
-class Shorekeeper(Cube):
-    name = 'Shorekeeper'
-    skill_effect = 'Rolls only 2 or 3'
+        if max_stack_order > 0 and self.skill_rng.random() < self.skill_chance:
+            self.game.moves_last_next_round = self
+            self._record_skill()
 
-    def roll_die(self) -> None:
-        self.die_rolled = random.choice([2, 3])
-        self.last_action['die_rolled'] = self.die_rolled
+        self.game.board.move_stack(moving_stack, target_position, max_stack_order)
 
 
 class Camellya(Cube):
     name = 'Camellya'
-    skill_effect = '50% chance to get +1 per cube on same pad'
-
-    def take_turn(self) -> None | dict:
-        self.last_action = {'cube_name': self.name}
-
-        self.roll_die()
-        self._apply_skill_before_move()
+    __slots__ = ()
 
-        # Find all cubes in the same stack that will move together
+    def _find_moving_stack(self) -> Tuple[List['Cube'], int]:
         new_position = min(self.position + self.die_rolled + self.extra_moves, self.game.num_of_pads - 1)
         stack = self.game.get_stack_at_position(self.position)
 
-        # Trigger skill
-        if len(stack) > 1 and random.random() < 0.5:
+        # Leaves the stack behind, one pad further for every other cube in it
+        if len(stack) > 1 and self.skill_rng.random() < self.skill_chance:
             new_position += len(stack) - 1
             for cube in stack:
                 if cube.stack_order > self.stack_order:
                     cube.stack_order -= 1
-            self.last_action['skill_activated'] = self.skill_effect
-            moving_stack = [self]
-        else:
-            moving_stack = sorted([c for c in stack if c.stack_order >= self.stack_order],
-                                  key=lambda x: x.stack_order)
-
-        self._move_stack_to_position(moving_stack, new_position)
-
-        self._apply_skill_after_move()
-
-        return self.last_action
+            self._record_skill()
+            return [self], new_position
+        return stack[stack.index(self):], new_position
 
 
-class Carlotta(Cube):
-    name = 'Carlotta'
-    skill_effect = '28% chance to move twice'
+def _cube_class(name: str) -> type:
+    # Cubes whose rules are all in their SKILLS entry don't need a class written out
+    return type(name, (Cube,), {'name': name, '__slots__': ()})
 
-    def _apply_skill_before_move(self) -> None:
-        if random.random() < 0.28:
-            self.extra_moves = self.die_rolled
-            self.last_action['skill_activated'] = self.skill_effect
 
-
-CUBE_CLASSES = {
-    'Roccia': Roccia,
-    'Brant': Brant,
-    'Phoebe': Phoebe,
-    'Zani': Zani,
-    'Cartethyia': Cartethyia,
-    'Cantarella': Cantarella,
-    'Jinhsi': Jinhsi,
-    'Changli': Changli,
-    'Calcharo': Calcharo,
-    'Shorekeeper': Shorekeeper,
-    'Camellya': Camellya,
-    'Carlotta': Carlotta
-}
+_SKILL_CLASSES = {cls.name: cls for cls in (Zani, Cartethyia, Cantarella, Jinhsi, Changli, Camellya)}
+CUBE_CLASSES = {name: _SKILL_CLASSES.get(name) or _cube_class(name) for name in SKILLS}
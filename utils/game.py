@@ -1,7 +1,13 @@
 import json
 import random
+import time
 from typing import List
+from utils.board import Board
+from utils.cubes import CUBE_CLASSES, Cube
 from utils.jsontools import CompactJSONEncoder
+from utils.recorder import ActionRecorder
+from utils.replay import Replay
+from utils.snapshot import GameState
 
 STANDING_TO_POSITIONS = {
     4: {0: [3, 0], 1: [2, 0], 2: [1, 0], 3: [0, 0]},
@@ -15,27 +21,101 @@ class CubieDerby:
                  num_of_pads: int,
                  starting_positions: dict = None,
                  randomize_order: bool = True,
-                 record_actions: bool = False):
-        from utils.cubes import CUBE_CLASSES, Cube
-
+                 record_actions: bool = False,
+                 rng: random.Random | None = None):
+        # Every die roll, shuffle and skill chance is drawn from here, the global random module by default
+        self._rng = rng if rng is not None else random
         self.cubes = [CUBE_CLASSES[cube](self) for cube in cubes]
+        self.lineup = list(self.cubes)
+        # Jinhsi's skill fires on other cubes' moves, they check this instead of searching every stack
+        self.jinhsi = next((cube for cube in self.lineup if cube.name == 'Jinhsi'), None)
         self.num_of_pads = num_of_pads
+        self.initial_positions = starting_positions
         self.starting_positions = starting_positions
         self.randomize_order = randomize_order
         self.record_actions = record_actions
+        # Cubes describe their turns in a dict when set, see iter_actions
+        self.build_actions = record_actions
+        # Counters and timings, off unless set to a utils.instrumentation.Instrumentation
+        self.instruments = None
         self.num_of_cubes = len(cubes)
+        self.board = Board(num_of_pads, self.num_of_cubes)
 
         # Game specific variables
         self.is_game_finished: bool | None = None
-        self.standings: List['Cube'] | None = None
+        self.standings: List[Cube] | None = None
         self.rounds: List | None = None
+        self.recorder: ActionRecorder | None = None
+        self.moves_last_next_round: Cube | None = None
+        # Index in self.cubes of the next cube to move this round
+        self.next_turn = 0
 
-    def play_game(self):
+    @property
+    def rng(self):
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng):
+        self._rng = rng
+        for cube in self.lineup:
+            cube.die_rng = cube.skill_rng = rng
+
+    def set_streams(self, shuffle_rng, die_rngs: List, skill_rngs: List):
+        # Separate streams for the turn order shuffles and for every cube's die rolls and skill chances,
+        # by lineup slot. Setting rng puts everything back on one stream.
+        self._rng = shuffle_rng
+        for cube, die_rng, skill_rng in zip(self.lineup, die_rngs, skill_rngs):
+            cube.die_rng, cube.skill_rng = die_rng, skill_rng
+
+    def reset(self):
+        # Puts the game back to its state before play_game, so the same cubes can play another race
         self.is_game_finished = False
+        self.standings = None
         self.rounds = []
+        self.moves_last_next_round = None
+        self.next_turn = 0
+        self.starting_positions = self.initial_positions
+        self.cubes[:] = self.lineup
+        for cube in self.cubes:
+            cube.reset()
+        if self.instruments is not None:
+            self.instruments.start_race()
+
+    def play_game(self):
+        self._start_game()
+        while not self.is_game_finished:
+            self._start_next_round(self.play_round())
+
+    def iter_actions(self):
+        """Plays a game and yields every action as it happens.
+
+        Each action is a dict with the round, cube name, die roll, the skill if it triggered and `moved`,
+        the (position, stack_order) of every cube the action changed. Nothing is kept unless record_actions
+        is set, and the game can be abandoned at any point by not asking for more.
+        """
+        self.build_actions = True
+        try:
+            self._start_game()
+            last_positions = {c.name: (c.position, c.stack_order) for c in self.lineup}
+            round_index = 0
+            while not self.is_game_finished:
+                for action in self._play_round_actions():
+                    moved = {}
+                    for c in self.lineup:
+                        position = (c.position, c.stack_order)
+                        if last_positions[c.name] != position:
+                            last_positions[c.name] = moved[c.name] = position
+                    yield dict(action, round=round_index, moved=moved)
+                self._start_next_round(self.moves_last_next_round)
+                round_index += 1
+        finally:
+            self.build_actions = self.record_actions
+
+    def _start_game(self):
+        self.reset()
 
         if self.randomize_order:
-            random.shuffle(self.cubes)
+            self.rng.shuffle(self.cubes)
 
         if self.starting_positions is not None:
             for cube in self.cubes:
@@ -46,37 +126,57 @@ class CubieDerby:
                 self.cubes[cube_idx].stack_order = len(self.cubes) - 1 - cube_idx
             self.starting_positions = {cube.name: [cube.position, cube.stack_order]
                                        for cube in self.cubes}
+        self.board.place_cubes(self.cubes)
+        if self.record_actions:
+            self.recorder = ActionRecorder([cube.name for cube in self.lineup])
+            self.recorder.start(self.starting_positions)
 
-        while not self.is_game_finished:
-            changli_cube = self.play_round()
-            random.shuffle(self.cubes)
-            if changli_cube is not None:
-                self.cubes.remove(changli_cube)
-                self.cubes.append(changli_cube)
+    def _start_next_round(self, changli_cube):
+        self.next_turn = 0
+        self.rng.shuffle(self.cubes)
+        if changli_cube is not None:
+            self.cubes.remove(changli_cube)
+            self.cubes.append(changli_cube)
+
+    def play_round(self, first_turn: int = 0):
+        for _ in self._play_round_actions(first_turn):
+            pass
+        return self.moves_last_next_round
 
-    def play_round(self):
+    def _play_round_actions(self, first_turn: int = 0):
+        # Plays one round, or what's left of it from first_turn, yielding the action of every turn
+        # (None unless actions are built)
         turn_order = self.cubes
+        instruments = self.instruments
 
-        changli_cube = None
+        # Set by Changli's skill for next round
+        if first_turn == 0:
+            self.moves_last_next_round = None
         actions_in_round = []
-        for cube in turn_order:
-            if self.is_game_finished:
-                break
-
-            action = cube.take_turn()
+        if self.record_actions:
+            self.recorder.start_round()
+        if instruments is not None:
+            instruments.start_round()
+        for cube in turn_order[first_turn:]:
+            action = cube.take_turn() if instruments is None else instruments.take_turn(cube)
+            self.next_turn += 1
             if self.record_actions:
-                action['positions'] = {c.name: (c.position, c.stack_order)
-                                       for c in self.cubes}
+                # Only the cubes that moved are stored, get_game_data rebuilds the full positions
+                self.recorder.record([(c.position, c.stack_order) for c in self.lineup])
                 actions_in_round.append(action)
 
-            # Trigger Changli's skill for next round
-            if action['cube_name'] == 'Changli' and action.get('skill_activated', None):
-                changli_cube = cube
-
             # Check for the winner
             if cube.position + 1 >= self.num_of_pads:
                 self.is_game_finished = True
-                self.determine_standings()
+                if instruments is None:
+                    self.determine_standings()
+                else:
+                    start = time.perf_counter()
+                    self.determine_standings()
+                    instruments.finish_race(time.perf_counter() - start)
+
+            yield action
+            if self.is_game_finished:
                 break
 
         if self.record_actions:
@@ -85,24 +185,86 @@ class CubieDerby:
                 'turn_order': [c.name for c in turn_order]
             })
 
-        return changli_cube
+    def snapshot(self) -> GameState:
+        # State of the race between two actions, restore() on any game with the same lineup carries on from it
+        index = {cube: i for i, cube in enumerate(self.lineup)}
+        return GameState(lineup=tuple(cube.name for cube in self.lineup),
+                         num_of_pads=self.num_of_pads,
+                         positions=tuple((cube.position, cube.stack_order) for cube in self.lineup),
+                         skill_activated=tuple(cube.skill_activated for cube in self.lineup),
+                         extra_moves=tuple(cube.extra_moves for cube in self.lineup),
+                         turn_order=tuple(index[cube] for cube in self.cubes),
+                         next_turn=self.next_turn,
+                         moves_last_next_round=(index[self.moves_last_next_round]
+                                                if self.moves_last_next_round is not None else None),
+                         is_finished=bool(self.is_game_finished))
+
+    def restore(self, state: GameState):
+        if state.lineup != tuple(cube.name for cube in self.lineup) or state.num_of_pads != self.num_of_pads:
+            raise ValueError('The state is from a race with a different lineup or track')
+
+        self.reset()
+        for cube, (position, stack_order), skill_activated, extra_moves in zip(
+                self.lineup, state.positions, state.skill_activated, state.extra_moves):
+            cube.position, cube.stack_order = position, stack_order
+            cube.skill_activated, cube.extra_moves = skill_activated, extra_moves
+        self.cubes[:] = [self.lineup[i] for i in state.turn_order]
+        self.next_turn = state.next_turn
+        self.moves_last_next_round = (self.lineup[state.moves_last_next_round]
+                                      if state.moves_last_next_round is not None else None)
+        self.starting_positions = {cube.name: [cube.position, cube.stack_order] for cube in self.lineup}
+        self.board.place_cubes(self.cubes)
+        if self.record_actions:
+            self.recorder = ActionRecorder([cube.name for cube in self.lineup])
+            self.recorder.start(self.starting_positions)
+
+        self.is_game_finished = state.is_finished
+        if self.is_game_finished:
+            self.determine_standings()
+
+    def resume_game(self):
+        # Plays the rest of a race put in place by restore()
+        if not self.is_game_finished and self.next_turn > 0:
+            if self.next_turn < len(self.cubes):
+                self.play_round(self.next_turn)
+            self._start_next_round(self.moves_last_next_round)
+        while not self.is_game_finished:
+            self._start_next_round(self.play_round())
 
     def get_stack_at_position(self, position: int) -> List:
-        return [c for c in self.cubes if c.position == position]
+        return self.board.get_stack(position)
 
     def determine_standings(self):
-        # Sort cubes by position (descending) and stack order (descending)
-        self.standings = sorted(self.cubes, key=lambda x: (-x.position, -x.stack_order))
+        # Cubes by position (descending) and stack order (descending)
+        self.standings = self.board.standings()
+
+    def state_at(self, round_index: int, action_index: int) -> dict:
+        # Positions of every cube after any recorded action, action_index -1 is the start of the round
+        return self.recorder.state_at(round_index, action_index)
 
     def get_game_data(self):
+        rounds = self.rounds
+        if self.recorder is not None:
+            rounds = []
+            for round_index, r in enumerate(self.rounds):
+                actions = []
+                for action_index, action in enumerate(r['actions']):
+                    state = self.recorder.state_at(round_index, action_index)
+                    actions.append(dict(action, positions={cube: state[cube] for cube in r['turn_order']}))
+                rounds.append({'actions': actions, 'turn_order': r['turn_order']})
+
         return {
             'number_of_cubes': self.num_of_cubes,
             'number_of_pads': self.num_of_pads,
             'starting_positions': self.starting_positions,
-            'rounds': self.rounds,
+            'rounds': rounds,
             'standings': [cube.name for cube in self.standings]
         }
 
     def write_results_to_json(self, fp):
         with open(fp, 'w') as out_file:
             json.dump(self.get_game_data(), out_file, cls=CompactJSONEncoder, indent=2)
+
+    def write_replay(self, fp):
+        # Compact binary alternative to the JSON file, see utils.replay
+        Replay.from_game(self).write(fp)
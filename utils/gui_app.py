@@ -3,11 +3,14 @@ from collections import defaultdict
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QGraphicsView, QGraphicsScene, QMessageBox,
                              QGraphicsTextItem, QGraphicsEllipseItem, QFileDialog, QSplitter,
-                             QCheckBox, QSpinBox, QGroupBox, QGridLayout)
+                             QCheckBox, QSpinBox, QGroupBox, QGridLayout, QSlider)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor, QFont, QBrush
 from utils.widgets import CubeListWidget
 from utils.game import CubieDerby
+from utils.racelog import SeedReplay
+from utils.recorder import ActionRecorder
+from utils.replay import Replay
 
 CUBE_COLOURS = {
     'Jinhsi': QColor(219, 217, 167),
@@ -190,6 +193,12 @@ class VisualisationPanel(QWidget):
         self.control_layout.addWidget(self.next_action_button)
         layout.addLayout(self.control_layout)
 
+        # Jump to any action of the game
+        self.action_slider = QSlider(Qt.Horizontal)
+        self.action_slider.setEnabled(False)
+        self.action_slider.valueChanged.connect(self.seek)
+        layout.addWidget(self.action_slider)
+
         layout.addStretch()
 
     def update_turn_order(self, cube_size=30, spacing=10):
@@ -257,7 +266,27 @@ class VisualisationPanel(QWidget):
         info_text = (f'{cube_name} rolled {die_rolled}'
                      + (f' - Skill activated: {skill_activated}' if skill_activated else ''))
         self.action_info_label.setText(info_text)
-        self.update_cube_positions(action['positions'])
+        self.update_cube_positions(SimulationData.get_current_positions())
+        self.sync_slider()
+
+    def sync_slider(self):
+        self.action_slider.blockSignals(True)
+        self.action_slider.setValue(SimulationData.get_num_of_actions_played())
+        self.action_slider.blockSignals(False)
+
+    def seek(self, num_of_actions):
+        SimulationData.seek(num_of_actions)
+        self.prev_action_button.setEnabled(num_of_actions > 0)
+        self.next_action_button.setEnabled(num_of_actions < SimulationData.recorder.num_of_actions)
+
+        if num_of_actions == 0:
+            self.round_label.setText('Starting Positions')
+            self.action_info_label.setText('Initial positions')
+            self.update_cube_positions(SimulationData.starting_positions)
+        else:
+            self.update_action_info(SimulationData.get_current_action())
+            self.round_label.setText(f'Round: {SimulationData.round_index + 1}')
+        self.update_turn_order()
 
     def next_action(self):
         self.prev_action_button.setEnabled(True)
@@ -293,7 +322,7 @@ class VisualisationPanel(QWidget):
             self.action_info_label.setText('Initial positions')
             self.update_cube_positions(SimulationData.starting_positions)
             self.update_turn_order()
-
+            self.sync_slider()
 
     def next_round(self):
         self.prev_action_button.setEnabled(True)
@@ -349,12 +378,18 @@ class CubieDerbyVisualiser(QMainWindow):
 
     def on_open_json_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, 'Open JSON File', '../examples', 'JSON Files (*.json);;All Files (*)')
+            self, 'Open JSON File', '../examples', 'Games (*.json *.replay);;All Files (*)')
 
         if file_path:
             try:
-                with open(file_path, 'r') as file:
-                    data = json.load(file)
+                if file_path.endswith('.replay'):
+                    data = Replay.load(file_path).to_game_data()
+                else:
+                    with open(file_path, 'r') as file:
+                        data = json.load(file)
+                    if 'rounds' not in data and 'seed' in data:
+                        # Seed-only replay, the race is played again to get its actions
+                        data = SeedReplay.from_dict(data).to_game_data()
             except json.JSONDecodeError:
                 self.visualisation_panel.content_label.setText('Error: The selected file is not a valid JSON file.')
             except Exception as e:
@@ -381,6 +416,9 @@ class CubieDerbyVisualiser(QMainWindow):
     def enable_controls(self):
         self.visualisation_panel.next_round_button.setEnabled(True)
         self.visualisation_panel.next_action_button.setEnabled(True)
+        self.visualisation_panel.action_slider.setRange(0, SimulationData.recorder.num_of_actions)
+        self.visualisation_panel.sync_slider()
+        self.visualisation_panel.action_slider.setEnabled(True)
 
 
 class SimulationData:
@@ -389,6 +427,7 @@ class SimulationData:
     starting_positions = None
     rounds = None
     standings = None
+    recorder: ActionRecorder | None = None
     round_index = 0
     action_index = -1
 
@@ -397,7 +436,11 @@ class SimulationData:
         cls.num_of_cubes = data['number_of_cubes']
         cls.num_of_pads = data['number_of_pads']
         cls.starting_positions = data['starting_positions']
-        cls.rounds = data['rounds']
+        # Positions are kept as deltas in the recorder, not with every action
+        cls.recorder = ActionRecorder.from_game_data(data)
+        cls.rounds = [{'actions': [{k: v for k, v in action.items() if k != 'positions'} for action in r['actions']],
+                       'turn_order': r['turn_order']}
+                      for r in data['rounds']]
         cls.standings = data['standings']
         cls.reset_indices()
 
@@ -406,6 +449,22 @@ class SimulationData:
         cls.round_index = 0
         cls.action_index = -1
 
+    @classmethod
+    def get_current_positions(cls):
+        if cls.action_index < 0:
+            return cls.starting_positions
+        return cls.recorder.state_at(cls.round_index, cls.action_index)
+
+    @classmethod
+    def get_num_of_actions_played(cls):
+        if cls.round_index < 0 or not cls.rounds:
+            return 0
+        return cls.recorder.round_starts[cls.round_index] + cls.action_index + 1
+
+    @classmethod
+    def seek(cls, num_of_actions):
+        cls.round_index, cls.action_index = cls.recorder.locate(num_of_actions)
+
     @classmethod
     def get_current_action(cls):
         if cls.round_index >= 0 and cls.action_index >= 0:
@@ -0,0 +1,125 @@
+from typing import Dict
+from utils.cubes import Cube
+
+# Phases of a turn timed by Cube.take_turn_timed, 'standings' is timed once per race
+PHASES = ('roll', 'skill_before_move', 'stack_lookup', 'move', 'skill_after_move', 'turn', 'standings')
+
+
+class Instrumentation:
+    """Counters and sampled phase timings of the scalar engine.
+
+    Off unless a game's `instruments` is set, e.g. `game.instruments = Instrumentation()`, the engine
+    then only checks for None. When on it counts races, rounds per race, turns and skill triggers per cube,
+    how often skills that fire on other cubes' moves (Jinhsi's) had the chance, and every `sample_every` turns
+    it times the phases of the turn, which keeps perf_counter out of most turns.
+    Instrumentation of separate games or worker processes is combined with merge.
+    """
+
+    def __init__(self, sample_every: int = 1000):
+        self.sample_every = sample_every
+        self.races = 0
+        self.turns = 0
+        self.turns_by_cube: Dict[str, int] = {}
+        self.skill_triggers: Dict[str, int] = {}
+        # Only for skills that fire on other cubes' moves: cube -> times the skill could have fired
+        self.skill_chances: Dict[str, int] = {}
+        # Rounds played in a race -> number of races
+        self.rounds_per_race: Dict[int, int] = {}
+        # Phase -> (total seconds, number of samples)
+        self.phase_times: Dict[str, list] = {}
+        self._rounds_in_race = 0
+
+    def take_turn(self, cube: Cube) -> None | dict:
+        self.turns += 1
+        self.turns_by_cube[cube.name] = self.turns_by_cube.get(cube.name, 0) + 1
+        if self.turns % self.sample_every:
+            return cube.take_turn()
+        return cube.take_turn_timed(self)
+
+    def skill_triggered(self, cube_name: str) -> None:
+        self.skill_triggers[cube_name] = self.skill_triggers.get(cube_name, 0) + 1
+
+    def skill_chance(self, cube_name: str) -> None:
+        self.skill_chances[cube_name] = self.skill_chances.get(cube_name, 0) + 1
+
+    def start_race(self) -> None:
+        # Rounds of an abandoned race aren't counted
+        self._rounds_in_race = 0
+
+    def start_round(self) -> None:
+        self._rounds_in_race += 1
+
+    def finish_race(self, standings_time: float) -> None:
+        self.races += 1
+        self.rounds_per_race[self._rounds_in_race] = self.rounds_per_race.get(self._rounds_in_race, 0) + 1
+        self.add_time('standings', standings_time)
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        total = self.phase_times.setdefault(phase, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+    def merge(self, other: 'Instrumentation') -> 'Instrumentation':
+        self.races += other.races
+        self.turns += other.turns
+        for mine, theirs in ((self.turns_by_cube, other.turns_by_cube),
+                             (self.skill_triggers, other.skill_triggers),
+                             (self.skill_chances, other.skill_chances),
+                             (self.rounds_per_race, other.rounds_per_race)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        for phase, (seconds, samples) in other.phase_times.items():
+            total = self.phase_times.setdefault(phase, [0.0, 0])
+            total[0] += seconds
+            total[1] += samples
+        return self
+
+    def to_dict(self) -> dict:
+        return {'sample_every': self.sample_every,
+                'races': self.races,
+                'turns': self.turns,
+                'turns_by_cube': self.turns_by_cube,
+                'skill_triggers': self.skill_triggers,
+                'skill_chances': self.skill_chances,
+                'rounds_per_race': [[rounds, count] for rounds, count in sorted(self.rounds_per_race.items())],
+                'phase_times': self.phase_times}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Instrumentation':
+        instruments = cls(data['sample_every'])
+        instruments.races = data['races']
+        instruments.turns = data['turns']
+        instruments.turns_by_cube = dict(data['turns_by_cube'])
+        instruments.skill_triggers = dict(data['skill_triggers'])
+        instruments.skill_chances = dict(data.get('skill_chances', {}))
+        instruments.rounds_per_race = {rounds: count for rounds, count in data['rounds_per_race']}
+        instruments.phase_times = {phase: list(total) for phase, total in data['phase_times'].items()}
+        return instruments
+
+    @property
+    def mean_rounds(self) -> float:
+        return sum(rounds * count for rounds, count in self.rounds_per_race.items()) / max(self.races, 1)
+
+    def report(self) -> str:
+        lines = [f'{self.races:,} races, {self.turns:,} turns, '
+                 f'{self.mean_rounds:.2f} rounds per race on average'
+                 + (f' ({min(self.rounds_per_race)} to {max(self.rounds_per_race)})' if self.rounds_per_race else ''),
+                 '',
+                 f'{"cube":<12} {"turns":>12} {"skill":>12} {"rate":>9}']
+        for cube, turns in sorted(self.turns_by_cube.items()):
+            triggers = self.skill_triggers.get(cube, 0)
+            if cube in self.skill_chances:
+                # Fires on other cubes' moves, so against the cubes landing on its pad rather than its own turns
+                chances = self.skill_chances[cube]
+                rate = f'{triggers / chances * 100:>8.2f}% of {chances:,} arrivals on its pad'
+            else:
+                rate = f'{triggers / turns * 100:>8.2f}% per turn'
+            lines.append(f'{cube:<12} {turns:>12,} {triggers:>12,} {rate}')
+
+        if self.phase_times:
+            lines += ['', f'{"phase":<18} {"mean us":>9} {"samples":>10}']
+            for phase in PHASES:
+                if phase in self.phase_times:
+                    seconds, samples = self.phase_times[phase]
+                    lines.append(f'{phase:<18} {seconds / samples * 1e6:>9.2f} {samples:>10,}')
+        return '\n'.join(lines)
@@ -1,4 +1,7 @@
 import json
+from typing import Iterable, Iterator
+
+_END = object()
 
 
 # "stolen" from https://gist.github.com/jannismain/e96666ca4f059c3e5bc28abb711b5c92
@@ -27,29 +30,64 @@ class CompactJSONEncoder(json.JSONEncoder):
             kwargs["indent"] = self.INDENTATION_WIDTH
 
         super().__init__(*args, **kwargs)
-        self.indentation_level = 0
 
     def encode(self, o):
         """Encode JSON object *o* with respect to single line lists."""
-        if isinstance(o, (list, tuple)):
-            if self._put_on_single_line(o):
-                return "[" + ", ".join(self.encode(el) for el in o) + "]"
+        return "".join(self.iterencode(o))
+
+    def iterencode(self, o, _one_shot=False):
+        """Yield the encoded document piece by piece, so `json.dump` can stream it to a file.
+
+        Containers are walked with an explicit stack, deep documents don't hit the recursion limit.
+        """
+        if not self._is_multi_line(o):
+            yield self._encode_single_line(o)
+            return
+
+        # Each frame: (items, is_dict, level of the container)
+        stack = [self._open(o, 0)]
+        yield "{\n" if stack[-1][1] else "[\n"
+        first = True
+        while stack:
+            items, is_dict, level = stack[-1]
+            item = next(items, _END)
+            if item is _END:
+                stack.pop()
+                yield "\n" + self._indent(level) + ("}" if is_dict else "]")
+                first = False
+                continue
+
+            prefix = "" if first else ",\n"
+            if is_dict:
+                key, item = item
+                prefix += self._indent(level + 1) + json.dumps(key) + ": "
             else:
-                self.indentation_level += 1
-                output = [self.indent_str + self.encode(el) for el in o]
-                self.indentation_level -= 1
-                return "[\n" + ",\n".join(output) + "\n" + self.indent_str + "]"
-        elif isinstance(o, dict):
-            if len(o) == 0:
-                return "{}"
+                prefix += self._indent(level + 1)
 
-            if self._put_on_single_line(o):
-                return "{ " + ", ".join(f"{self.encode(k)}: {self.encode(el)}" for k, el in o.items()) + " }"
+            if self._is_multi_line(item):
+                stack.append(self._open(item, level + 1))
+                yield prefix + ("{\n" if isinstance(item, dict) else "[\n")
+                first = True
             else:
-                self.indentation_level += 1
-                output = [self.indent_str + f"{json.dumps(k)}: {self.encode(v)}" for k, v in o.items()]
-                self.indentation_level -= 1
-                return "{\n" + ",\n".join(output) + "\n" + self.indent_str + "}"
+                yield prefix + self._encode_single_line(item)
+                first = False
+
+    @staticmethod
+    def _open(o, level):
+        if isinstance(o, dict):
+            return iter(o.items()), True, level
+        return iter(o), False, level
+
+    def _is_multi_line(self, o):
+        if isinstance(o, (list, tuple)):
+            return not self._put_on_single_line(o)
+        return isinstance(o, dict) and len(o) > 0
+
+    def _encode_single_line(self, o):
+        if isinstance(o, (list, tuple)):
+            return "[" + ", ".join(self._encode_single_line(el) for el in o) + "]"
+        elif isinstance(o, dict):
+            return "{}"
         elif isinstance(o, float):  # Use scientific notation for floats, where appropriate
             return format(o, "g")
         elif isinstance(o, str):  # escape newlines
@@ -58,16 +96,36 @@ class CompactJSONEncoder(json.JSONEncoder):
         else:
             return json.dumps(o)
 
-    def iterencode(self, o, **kwargs):
-        """Required to also work with `json.dump`."""
-        return self.encode(o)
-
     def _put_on_single_line(self, o):
         if isinstance(o, (list, tuple)) and all(isinstance(i, self.SINGLE_LINE_TYPES) for i in o):
-            return len(o) <= self.MAX_ITEMS and len(str(o)) - 2 <= self.MAX_WIDTH
+            if len(o) > self.MAX_ITEMS:
+                return False
+            # Width of str(o) without the brackets, without building the string
+            width = sum(len(str(i)) for i in o) + 2 * (len(o) - 1) + (len(o) == 1 and isinstance(o, tuple))
+            return width <= self.MAX_WIDTH
 
         return False
 
-    @property
-    def indent_str(self) -> str:
-        return self.INDENTATION_CHAR * (self.indentation_level * self.indent)
+    def _indent(self, level) -> str:
+        return self.INDENTATION_CHAR * (level * self.indent)
+
+
+def append_json_lines(fp, documents: Iterable) -> int:
+    """Append each document to a JSON Lines file as one compact line, returns how many were written.
+
+    Documents are written as they come, so a generator of recorded games is dumped in constant memory.
+    """
+    count = 0
+    with open(fp, 'a') as out_file:
+        for document in documents:
+            out_file.write(json.dumps(document, separators=(',', ':')))
+            out_file.write('\n')
+            count += 1
+    return count
+
+
+def read_json_lines(fp) -> Iterator:
+    with open(fp, 'r') as in_file:
+        for line in in_file:
+            if line.strip():
+                yield json.loads(line)
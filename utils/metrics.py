@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+from utils.results import RaceResults
+
+try:
+    import resource
+except ImportError:
+    # Windows, worker memory isn't reported
+    resource = None
+
+
+def peak_memory() -> int | None:
+    # Peak resident memory of this process in bytes
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class MetricsExporter:
+    """Live metrics of a running simulation, rewritten to a file every `interval` seconds.
+
+    Races done, races/s overall and per worker, ETA, the current win rates and the peak memory of every worker.
+    Files ending in .prom get the Prometheus text format (e.g. for node_exporter's textfile collector),
+    anything else JSON. The file is replaced in one rename, readers never see half of it.
+    A worker whose seconds_since_last_chunk keeps growing has stalled.
+    """
+
+    def __init__(self, path: str, total: int, cube_names: List[str], interval: float = 5.0):
+        self.path = path
+        self.total = total
+        self.cube_names = list(cube_names)
+        self.interval = interval
+        self.completed = 0
+        self.start_time = time.time()
+        self.last_write = 0.0
+        # pid -> races, seconds spent playing them, peak memory and when its last chunk arrived
+        self.workers: Dict[int, dict] = {}
+        self.results: RaceResults | None = None
+
+    def update(self, simulation_count: int, worker: dict, results: RaceResults | None = None):
+        # worker is the dict run_monitored_chunk returns, results the merged results so far
+        self.completed += simulation_count
+        stats = self.workers.setdefault(worker['pid'], {'races': 0, 'seconds': 0.0})
+        stats['races'] += simulation_count
+        stats['seconds'] += worker['seconds']
+        stats['max_rss'] = worker['max_rss']
+        stats['last_seen'] = time.time()
+        if results is not None:
+            self.results = results
+
+        if time.time() - self.last_write >= self.interval or self.completed >= self.total:
+            self.write()
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        elapsed = now - self.start_time
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        win_rates = {}
+        if self.results is not None and self.results.num_of_games:
+            win_rates = {cube: wins / self.results.num_of_games for cube, wins in self.results.wins.items()}
+
+        return {'time': now,
+                'races_completed': self.completed,
+                'races_total': self.total,
+                'elapsed_seconds': elapsed,
+                'races_per_second': rate,
+                'eta_seconds': (self.total - self.completed) / rate if rate > 0 else None,
+                'win_rates': win_rates,
+                'workers': [{'pid': pid,
+                             'races': stats['races'],
+                             'races_per_second': stats['races'] / stats['seconds'] if stats['seconds'] > 0 else 0.0,
+                             'max_rss_bytes': stats['max_rss'],
+                             'seconds_since_last_chunk': now - stats['last_seen']}
+                            for pid, stats in sorted(self.workers.items())]}
+
+    def write(self):
+        snapshot = self.snapshot()
+        text = _to_prometheus(snapshot) if self.path.endswith('.prom') else json.dumps(snapshot, indent=2)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+        self.last_write = time.time()
+
+
+def _to_prometheus(snapshot: dict) -> str:
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP cubie_{name} {help_text}')
+        lines.append(f'# TYPE cubie_{name} {kind}')
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}' if labels else ''
+            lines.append(f'cubie_{name}{label_text} {value}')
+
+    metric('races_completed', 'counter', 'Races finished so far', [({}, snapshot['races_completed'])])
+    metric('races_total', 'gauge', 'Races in the run', [({}, snapshot['races_total'])])
+    metric('races_per_second', 'gauge', 'Races per second since the start', [({}, snapshot['races_per_second'])])
+    metric('eta_seconds', 'gauge', 'Estimated seconds left', [({}, snapshot['eta_seconds'])])
+    metric('win_rate', 'gauge', 'Share of the races won so far',
+           [({'cube': cube}, rate) for cube, rate in snapshot['win_rates'].items()])
+    workers = snapshot['workers']
+    metric('worker_races', 'counter', 'Races played by the worker',
+           [({'pid': w['pid']}, w['races']) for w in workers])
+    metric('worker_races_per_second', 'gauge', 'Races per second of the worker while playing',
+           [({'pid': w['pid']}, w['races_per_second']) for w in workers])
+    metric('worker_max_rss_bytes', 'gauge', 'Peak resident memory of the worker',
+           [({'pid': w['pid']}, w['max_rss_bytes']) for w in workers])
+    metric('worker_seconds_since_last_chunk', 'gauge', 'Seconds since the worker last finished a chunk',
+           [({'pid': w['pid']}, w['seconds_since_last_chunk']) for w in workers])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,158 @@
+import multiprocessing as mp
+import random
+from statistics import NormalDist
+from typing import List, Tuple
+import numpy as np
+from utils.game import CubieDerby
+from utils.parallel import ProgressReporter, RaceConfig
+from utils.rng import DEFAULT_CHUNK_SIZE, numpy_chunk_rng, split_into_chunks
+
+# Draws kept ready per stream and race, a stream that runs out carries on from its own fallback generator
+DRAWS_PER_STREAM = 64
+
+
+class UniformStream:
+    """Serves the draws of one stream from a list of uniforms, in place of a random.Random.
+
+    Only random, choice and shuffle are provided, that's all the engine asks for.
+    """
+
+    __slots__ = ('values', 'index', '_fallback')
+
+    def __init__(self, values: List[float]):
+        self.values = values
+        self.index = 0
+        self._fallback = None
+
+    def random(self) -> float:
+        if self.index < len(self.values):
+            value = self.values[self.index]
+            self.index += 1
+            return value
+        if self._fallback is None:
+            # Seeded from the stream itself, so every configuration gets the same extra draws
+            self._fallback = random.Random(self.values[0])
+        return self._fallback.random()
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def shuffle(self, x: list) -> None:
+        for i in range(len(x) - 1, 0, -1):
+            j = int(self.random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+
+def play_paired_chunk(task: Tuple[List[RaceConfig], int, int, int]) -> Tuple[int, np.ndarray]:
+    """Plays the same races under every configuration, returns (count, places[config, race, slot]).
+
+    Each race gets fresh streams: one for the turn order shuffles, and per lineup slot one for the die rolls
+    and one for the skill chances. The cube in a slot rolls the same dice on its n-th turn in every
+    configuration, while the streams for skills only stay in step as long as the races do.
+    """
+    configs, seed, chunk_index, count = task
+    num_of_cubes = len(configs[0].cubes)
+    games = [CubieDerby(config.cubes, config.num_of_pads, config.starting_positions, config.randomize_order)
+             for config in configs]
+    rng = numpy_chunk_rng(seed, chunk_index)
+
+    places = np.empty((len(configs), count, num_of_cubes), dtype=np.uint8)
+    for race in range(count):
+        draws = rng.random((2 * num_of_cubes + 1, DRAWS_PER_STREAM)).tolist()
+        for c, game in enumerate(games):
+            game.set_streams(UniformStream(draws[0]),
+                             [UniformStream(values) for values in draws[1:num_of_cubes + 1]],
+                             [UniformStream(values) for values in draws[num_of_cubes + 1:]])
+            game.play_game()
+            slot = {cube: i for i, cube in enumerate(game.lineup)}
+            for place, cube in enumerate(game.standings):
+                places[c, race, slot[cube]] = place
+    return count, places
+
+
+class PairedResults:
+    """Places of every lineup slot in races played under two or more configurations with the same random draws.
+
+    Differences are taken race by race against the baseline configuration, so the noise the configurations
+    share cancels out. `difference` gives the paired interval next to the one two independent runs of the same
+    size would have, the ratio of their variances is how many times fewer races the paired run needs.
+    """
+
+    def __init__(self, configs: List[RaceConfig], places: np.ndarray):
+        self.configs = configs
+        # places[config, race, slot] -> finishing place, 0 is the winner
+        self.places = places
+
+    @property
+    def num_of_games(self) -> int:
+        return self.places.shape[1]
+
+    def slot_names(self, config: int) -> List[str]:
+        return list(self.configs[config].cubes)
+
+    def _metric(self, metric: str) -> np.ndarray:
+        if metric == 'win':
+            return (self.places == 0).astype(np.float64)
+        if metric == 'place':
+            return self.places.astype(np.float64) + 1
+        raise ValueError(f'Unknown metric: {metric}, use "win" or "place"')
+
+    def mean(self, metric: str = 'win') -> np.ndarray:
+        # mean[config, slot] -> win probability or mean place
+        return self._metric(metric).mean(axis=1)
+
+    def difference(self, config: int, baseline: int = 0, metric: str = 'win',
+                   confidence: float = 0.95) -> List[Tuple[float, float, float]]:
+        # Per slot (mean of config - baseline, paired half width, half width of independent runs)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        values = self._metric(metric)
+        a, b = values[baseline], values[config]
+        n = self.num_of_games
+        paired = np.sqrt((b - a).var(axis=0, ddof=1) / n)
+        independent = np.sqrt((a.var(axis=0, ddof=1) + b.var(axis=0, ddof=1)) / n)
+        return [(float(d), float(z * p), float(z * i))
+                for d, p, i in zip((b - a).mean(axis=0), paired, independent)]
+
+    def report(self, metric: str = 'win', confidence: float = 0.95) -> str:
+        label = 'win rate' if metric == 'win' else 'mean place'
+        lines = [f'{self.num_of_games:,} paired races, {label} against configuration 0, '
+                 f'{confidence * 100:g}% intervals']
+        for config in range(1, len(self.configs)):
+            lines += ['', f'Configuration {config} - configuration 0']
+            for slot, (d, paired, independent) in enumerate(self.difference(config, 0, metric, confidence)):
+                names = self.slot_names(0)[slot], self.slot_names(config)[slot]
+                name = names[0] if names[0] == names[1] else f'{names[1]} vs {names[0]}'
+                scale = 100 if metric == 'win' else 1
+                saving = f'{(independent / paired) ** 2:.1f}x the races' if paired > 0 else 'same in every race'
+                lines.append(f'{name:<24} {d * scale:+8.3f} +- {paired * scale:.3f} '
+                             f'(independent runs: +- {independent * scale:.3f}, {saving})')
+        return '\n'.join(lines)
+
+
+def run_paired_comparison(configs: List[RaceConfig],
+                          number_of_simulations: int,
+                          seed: int = 0,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          processes: int | None = None,
+                          show_progress: bool = True) -> PairedResults:
+    """Plays number_of_simulations races under each configuration with common random numbers.
+
+    Configurations can differ in lineup (cubes are paired by slot), starting positions or track,
+    but must have the same number of cubes. Their seeds are not used, the races are fixed by `seed`.
+    """
+    if len({len(config.cubes) for config in configs}) != 1:
+        raise ValueError('All configurations need the same number of cubes')
+
+    processes = processes if processes is not None else max(1, mp.cpu_count() - 1)
+    chunks = split_into_chunks(number_of_simulations, chunk_size)
+    progress = ProgressReporter(number_of_simulations) if show_progress else None
+
+    places = [None] * len(chunks)
+    with mp.Pool(processes=processes) as pool:
+        tasks = [(configs, seed, chunk_index, count) for chunk_index, count in chunks]
+        for chunk_index, (count, chunk_places) in enumerate(pool.imap(play_paired_chunk, tasks)):
+            places[chunk_index] = chunk_places
+            if progress is not None:
+                progress.update(count)
+
+    return PairedResults(configs, np.concatenate(places, axis=1))
@@ -0,0 +1,167 @@
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Tuple
+import numpy as np
+from utils.game import CubieDerby
+from utils.instrumentation import Instrumentation
+from utils.metrics import MetricsExporter, peak_memory
+from utils.results import RaceResults
+from utils.rng import DEFAULT_CHUNK_SIZE, chunk_rng, race_seed, split_into_chunks
+
+
+@dataclass
+class RaceConfig:
+    cubes: List[str]
+    num_of_pads: int
+    starting_positions: dict | None = None
+    randomize_order: bool = True
+    seed: int = 0
+
+
+# Set once per worker process by _init_worker
+_worker_config: RaceConfig | None = None
+_worker_race: CubieDerby | None = None
+
+
+def _init_worker(config: RaceConfig, instrument: bool = False):
+    global _worker_config, _worker_race
+    _worker_config = config
+    _worker_race = CubieDerby(cubes=config.cubes,
+                              num_of_pads=config.num_of_pads,
+                              starting_positions=config.starting_positions,
+                              randomize_order=config.randomize_order)
+    if instrument:
+        _worker_race.instruments = Instrumentation()
+
+
+def play_chunk(race: CubieDerby, seed: int, chunk_index: int, simulation_count: int) -> RaceResults:
+    # The races of one chunk are fixed by the seed and chunk index, whichever process plays them
+    race.rng = chunk_rng(seed, chunk_index)
+
+    results = RaceResults([cube.name for cube in race.lineup])
+    if race.instruments is not None:
+        # Each chunk brings back the counts of its own races
+        race.instruments = results.instruments = Instrumentation(race.instruments.sample_every)
+    cube_index = {cube: i for i, cube in enumerate(race.lineup)}
+    for _ in range(simulation_count):
+        race.play_game()
+        results.record(tuple([cube_index[c] for c in race.standings]))
+    return results
+
+
+def run_chunk(chunk: Tuple[int, int]) -> Tuple[int, int, RaceResults]:
+    # Plays one chunk of races on the worker's game, returns (chunk_index, simulation_count, results)
+    chunk_index, simulation_count = chunk
+    return chunk_index, simulation_count, play_chunk(_worker_race, _worker_config.seed, chunk_index, simulation_count)
+
+
+def run_monitored_chunk(chunk: Tuple[int, int]) -> Tuple[int, int, RaceResults, dict]:
+    # Like run_chunk, also says which worker played it, how long it took and the worker's peak memory
+    start = time.perf_counter()
+    chunk_index, simulation_count, results = run_chunk(chunk)
+    worker = {'pid': os.getpid(), 'seconds': time.perf_counter() - start, 'max_rss': peak_memory()}
+    return chunk_index, simulation_count, results, worker
+
+
+def run_logged_chunk(chunk: Tuple[int, int]) -> Tuple[int, int, np.ndarray]:
+    # Like run_chunk, but every race is seeded on its own so it can be replayed from its seed,
+    # returns the finishing order of every race as cube indices
+    chunk_index, simulation_count = chunk
+    race = _worker_race
+    race.rng = random.Random()
+
+    orders = np.empty((simulation_count, len(race.lineup)), dtype=np.uint8)
+    cube_index = {cube: i for i, cube in enumerate(race.lineup)}
+    for i in range(simulation_count):
+        race.rng.seed(race_seed(_worker_config.seed, chunk_index, i))
+        race.play_game()
+        orders[i] = [cube_index[c] for c in race.standings]
+
+    return chunk_index, simulation_count, orders
+
+
+class ProgressReporter:
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.completed = 0
+        self.stream = stream
+        self.start_time = time.perf_counter()
+
+    def update(self, simulation_count: int):
+        self.completed += simulation_count
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        eta = _format_duration((self.total - self.completed) / rate) if rate > 0 else '?'
+        self.stream.write(f'\r{self.completed:,}/{self.total:,} races '
+                          f'({self.completed / self.total * 100:5.1f}%, {rate:,.0f} races/s, ETA {eta})  ')
+        if self.completed >= self.total:
+            self.stream.write('\n')
+        self.stream.flush()
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+
+class SimulationPool:
+    """A process pool whose workers each hold one reusable game for the given lineup.
+
+    Work is handed out in small chunks as workers become free, so slow workers don't hold up the run.
+    """
+
+    def __init__(self, config: RaceConfig, processes: int | None = None, instrument: bool = False):
+        self.config = config
+        self.processes = processes if processes is not None else max(1, mp.cpu_count() - 1)
+        self.instrument = instrument
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = mp.Pool(processes=self.processes, initializer=_init_worker,
+                             initargs=(self.config, self.instrument))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+
+    def imap_chunks(self, chunks: Iterable[Tuple[int, int]],
+                    run: Callable = run_chunk) -> Iterator[Tuple[int, int, RaceResults]]:
+        return self._pool.imap_unordered(run, chunks)
+
+    def run(self, number_of_simulations: int,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            show_progress: bool = True,
+            metrics_path: str | None = None) -> RaceResults:
+        results = RaceResults(self.config.cubes)
+        progress = ProgressReporter(number_of_simulations) if show_progress else None
+        metrics = MetricsExporter(metrics_path, number_of_simulations, self.config.cubes) if metrics_path else None
+
+        chunks = split_into_chunks(number_of_simulations, chunk_size)
+        for _, simulation_count, chunk_results, worker in self.imap_chunks(chunks, run=run_monitored_chunk):
+            results.merge(chunk_results)
+            if progress is not None:
+                progress.update(simulation_count)
+            if metrics is not None:
+                metrics.update(simulation_count, worker, results)
+
+        return results
+
+
+def run_simulation(config: RaceConfig,
+                   number_of_simulations: int,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   processes: int | None = None,
+                   show_progress: bool = True,
+                   instrument: bool = False,
+                   metrics_path: str | None = None) -> RaceResults:
+    # With instrument set, results.instruments holds the counters and timings of all workers.
+    # With metrics_path set, live metrics of the run are kept in that file, see MetricsExporter
+    with SimulationPool(config, processes, instrument) as pool:
+        return pool.run(number_of_simulations, chunk_size, show_progress, metrics_path)
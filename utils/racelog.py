@@ -0,0 +1,113 @@
+import json
+import random
+from dataclasses import asdict, dataclass
+from typing import List
+import numpy as np
+from utils.cubes import ENGINE_VERSION
+from utils.game import CubieDerby
+from utils.parallel import ProgressReporter, RaceConfig, SimulationPool, run_logged_chunk
+from utils.results import RaceResults
+from utils.rng import DEFAULT_CHUNK_SIZE, race_seed, split_into_chunks
+
+
+@dataclass
+class SeedReplay:
+    """A race stored as what decides it, the full action log is played again when it's opened.
+
+    Recording doesn't draw any randomness, so the same seed gives the same race with or without it.
+    Only valid for the engine version that played the race.
+    """
+    lineup: List[str]
+    num_of_pads: int
+    seed: int
+    starting_positions: dict | None = None
+    randomize_order: bool = True
+    engine_version: int = ENGINE_VERSION
+
+    def play(self) -> CubieDerby:
+        if self.engine_version != ENGINE_VERSION:
+            raise ValueError(f'Race was played with engine version {self.engine_version}, '
+                             f'this is version {ENGINE_VERSION}')
+        game = CubieDerby(self.lineup, self.num_of_pads, self.starting_positions, self.randomize_order,
+                          record_actions=True, rng=random.Random(self.seed))
+        game.play_game()
+        return game
+
+    def to_game_data(self) -> dict:
+        return self.play().get_game_data()
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SeedReplay':
+        return cls(**data)
+
+
+class RaceLog:
+    """Finishing order of every race of a logged run, one byte per cube and race.
+
+    Every race of the run had its own seed, so any of them can be turned back into a `SeedReplay`.
+    Stored as `<path>.npy` (the orders, memory-mapped when loaded) and `<path>.json` (config and chunk size).
+    """
+
+    def __init__(self, config: RaceConfig, chunk_size: int, orders: np.ndarray,
+                 engine_version: int = ENGINE_VERSION):
+        self.config = config
+        self.chunk_size = chunk_size
+        # orders[race_number, place] -> cube index, winner first
+        self.orders = orders
+        self.engine_version = engine_version
+
+    @property
+    def num_of_races(self) -> int:
+        return len(self.orders)
+
+    def replay(self, race_number: int) -> SeedReplay:
+        chunk_index, race_index = divmod(race_number, self.chunk_size)
+        return SeedReplay(lineup=list(self.config.cubes),
+                          num_of_pads=self.config.num_of_pads,
+                          seed=race_seed(self.config.seed, chunk_index, race_index),
+                          starting_positions=self.config.starting_positions,
+                          randomize_order=self.config.randomize_order,
+                          engine_version=self.engine_version)
+
+    def races_won_by(self, cube: str) -> np.ndarray:
+        return np.flatnonzero(self.orders[:, 0] == self.config.cubes.index(cube))
+
+    def results(self) -> RaceResults:
+        results = RaceResults(self.config.cubes)
+        results.add_standings(self.orders)
+        return results
+
+    @classmethod
+    def load(cls, path: str) -> 'RaceLog':
+        with open(f'{path}.json', 'r') as f:
+            header = json.load(f)
+        return cls(RaceConfig(**header['config']), header['chunk_size'],
+                   np.load(f'{path}.npy', mmap_mode='r'), header['engine_version'])
+
+
+def run_logged_simulation(config: RaceConfig,
+                          number_of_simulations: int,
+                          path: str,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          processes: int | None = None,
+                          show_progress: bool = True) -> RaceLog:
+    """Plays the races like `run_simulation`, but seeds each race on its own and logs every finishing order."""
+    with open(f'{path}.json', 'w') as f:
+        json.dump({'config': asdict(config), 'chunk_size': chunk_size, 'engine_version': ENGINE_VERSION}, f)
+    orders = np.lib.format.open_memmap(f'{path}.npy', mode='w+', dtype=np.uint8,
+                                       shape=(number_of_simulations, len(config.cubes)))
+
+    progress = ProgressReporter(number_of_simulations) if show_progress else None
+    with SimulationPool(config, processes) as pool:
+        chunks = split_into_chunks(number_of_simulations, chunk_size)
+        for chunk_index, simulation_count, chunk_orders in pool.imap_chunks(chunks, run_logged_chunk):
+            start = chunk_index * chunk_size
+            orders[start:start + simulation_count] = chunk_orders
+            if progress is not None:
+                progress.update(simulation_count)
+    orders.flush()
+
+    return RaceLog(config, chunk_size, orders)
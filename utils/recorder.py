@@ -0,0 +1,88 @@
+import bisect
+from typing import Dict, List, Tuple
+
+DEFAULT_KEYFRAME_INTERVAL = 16
+
+
+class ActionRecorder:
+    """Board states of a recorded game, stored as the cubes that changed in each action.
+
+    Every `keyframe_interval` actions the full state is kept as well, so `state_at` only has to apply
+    a handful of deltas to the nearest keyframe, whatever the length of the race.
+    """
+
+    def __init__(self, cube_names: List[str], keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL):
+        self.cube_names = list(cube_names)
+        self.keyframe_interval = keyframe_interval
+        # keyframes[k] -> state after k * keyframe_interval actions, as (position, stack_order) per cube
+        self.keyframes: List[Tuple[Tuple[int, int], ...]] = []
+        # deltas[i] -> ((cube_idx, position, stack_order), ...) changed by action i
+        self.deltas: List[tuple] = []
+        # Index of the first action of every round
+        self.round_starts: List[int] = []
+        self._state: List[Tuple[int, int]] = []
+
+    @property
+    def num_of_actions(self) -> int:
+        return len(self.deltas)
+
+    def start(self, positions: Dict[str, Tuple[int, int]]):
+        self._state = [tuple(positions[cube]) for cube in self.cube_names]
+        self.keyframes = [tuple(self._state)]
+        self.deltas = []
+        self.round_starts = []
+
+    def start_round(self):
+        self.round_starts.append(len(self.deltas))
+
+    def record(self, positions: List[Tuple[int, int]]) -> tuple:
+        # positions are (position, stack_order) per cube in cube_names order,
+        # only the cubes that differ from the previous action are kept
+        state = self._state
+        delta = []
+        for i, position in enumerate(positions):
+            if state[i] != position:
+                state[i] = position
+                delta.append((i,) + position)
+        delta = tuple(delta)
+        self.deltas.append(delta)
+        if len(self.deltas) % self.keyframe_interval == 0:
+            self.keyframes.append(tuple(state))
+        return delta
+
+    def state_at(self, round_index: int, action_index: int) -> Dict[str, Tuple[int, int]]:
+        """Positions after the given action of the given round, action_index -1 is the start of the round."""
+        if not 0 <= round_index < len(self.round_starts):
+            raise IndexError(f'Round {round_index} out of range')
+        round_end = (self.round_starts[round_index + 1] if round_index + 1 < len(self.round_starts)
+                     else len(self.deltas))
+        num_of_actions = self.round_starts[round_index] + action_index + 1
+        if not self.round_starts[round_index] <= num_of_actions <= round_end:
+            raise IndexError(f'Action {action_index} out of range in round {round_index}')
+        return self.state_after(num_of_actions)
+
+    def state_after(self, num_of_actions: int) -> Dict[str, Tuple[int, int]]:
+        # State once the first num_of_actions actions of the game were played
+        keyframe = num_of_actions // self.keyframe_interval
+        state = list(self.keyframes[keyframe])
+        for delta in self.deltas[keyframe * self.keyframe_interval:num_of_actions]:
+            for i, position, stack_order in delta:
+                state[i] = (position, stack_order)
+        return dict(zip(self.cube_names, state))
+
+    def locate(self, num_of_actions: int) -> Tuple[int, int]:
+        # (round_index, action_index) of the state after num_of_actions actions, like state_at takes them
+        round_index = max(bisect.bisect_right(self.round_starts, num_of_actions - 1) - 1, 0)
+        return round_index, num_of_actions - self.round_starts[round_index] - 1
+
+    @classmethod
+    def from_game_data(cls, data: dict, keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL) -> 'ActionRecorder':
+        # Rebuilds the recorder from the positions stored with every action, e.g. a loaded JSON file
+        recorder = cls(list(data['starting_positions']), keyframe_interval)
+        recorder.start(data['starting_positions'])
+        for r in data['rounds']:
+            recorder.start_round()
+            for action in r['actions']:
+                positions = action['positions']
+                recorder.record([tuple(positions[cube]) for cube in recorder.cube_names])
+        return recorder
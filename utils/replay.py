@@ -0,0 +1,151 @@
+import json
+import struct
+from typing import List
+import numpy as np
+from utils.cubes import ENGINE_VERSION
+from utils.skills import SKILLS
+
+MAGIC = b'CDRP'
+FORMAT_VERSION = 1
+# Magic, format version, header length
+PREAMBLE = struct.Struct('<4sHI')
+
+
+def record_dtype(num_of_cubes: int) -> np.dtype:
+    # One fixed-width record per action, positions and stack orders are indexed like the lineup
+    return np.dtype([('round', '<u4'),
+                     ('cube', 'u1'),
+                     ('die_rolled', 'u1'),
+                     ('skill_activated', '?'),
+                     ('position', '<i2', (num_of_cubes,)),
+                     ('stack_order', 'u1', (num_of_cubes,))])
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+class Replay:
+    """A recorded game as numpy arrays instead of nested dicts.
+
+    On disk it's a small JSON header (lineup, pads, starting positions, standings) followed by the turn order
+    of every round and one fixed-width record per action. `load` maps the arrays straight from the file.
+    """
+
+    def __init__(self, lineup: List[str], num_of_pads: int, starting_positions: dict, standings: List[str],
+                 turn_orders: np.ndarray, actions: np.ndarray):
+        self.lineup = list(lineup)
+        self.num_of_pads = num_of_pads
+        self.starting_positions = starting_positions
+        self.standings = standings
+        # turn_orders[round, i] -> lineup index of the cube moving i-th in that round
+        self.turn_orders = turn_orders
+        self.actions = actions
+
+    @property
+    def num_of_rounds(self) -> int:
+        return len(self.turn_orders)
+
+    def round_actions(self, round_index: int) -> np.ndarray:
+        start, end = np.searchsorted(self.actions['round'], [round_index, round_index + 1])
+        return self.actions[start:end]
+
+    @classmethod
+    def from_game(cls, game) -> 'Replay':
+        if not game.record_actions:
+            raise ValueError('The game has to be played with record_actions=True')
+        return cls.from_game_data(game.get_game_data())
+
+    @classmethod
+    def from_game_data(cls, data: dict) -> 'Replay':
+        lineup = list(data['starting_positions'])
+        index = {cube: i for i, cube in enumerate(lineup)}
+        rounds = data['rounds']
+
+        turn_orders = np.array([[index[cube] for cube in r['turn_order']] for r in rounds],
+                               dtype=np.uint8).reshape(len(rounds), len(lineup))
+        actions = np.zeros(sum(len(r['actions']) for r in rounds), dtype=record_dtype(len(lineup)))
+        i = 0
+        for round_index, r in enumerate(rounds):
+            for action in r['actions']:
+                record = actions[i]
+                record['round'] = round_index
+                record['cube'] = index[action['cube_name']]
+                record['die_rolled'] = action['die_rolled']
+                record['skill_activated'] = 'skill_activated' in action
+                for cube, (position, stack_order) in action['positions'].items():
+                    record['position'][index[cube]] = position
+                    record['stack_order'][index[cube]] = stack_order
+                i += 1
+
+        return cls(lineup, data['number_of_pads'], data['starting_positions'], data['standings'],
+                   turn_orders, actions)
+
+    def to_game_data(self) -> dict:
+        # Same layout as CubieDerby.get_game_data, for the visualiser and the JSON files
+        rounds = []
+        for round_index, turn_order in enumerate(self.turn_orders.tolist()):
+            names = [self.lineup[c] for c in turn_order]
+            actions = []
+            for record in self.round_actions(round_index):
+                cube = self.lineup[record['cube']]
+                action = {'cube_name': cube, 'die_rolled': int(record['die_rolled'])}
+                if record['skill_activated']:
+                    action['skill_activated'] = SKILLS[cube].description
+                positions = record['position'].tolist()
+                stack_orders = record['stack_order'].tolist()
+                # Keyed in turn order, like the recorder does
+                action['positions'] = {self.lineup[c]: (positions[c], stack_orders[c]) for c in turn_order}
+                actions.append(action)
+            rounds.append({'actions': actions, 'turn_order': names})
+
+        return {
+            'number_of_cubes': len(self.lineup),
+            'number_of_pads': self.num_of_pads,
+            'starting_positions': self.starting_positions,
+            'rounds': rounds,
+            'standings': self.standings
+        }
+
+    def write(self, fp):
+        header = json.dumps({'lineup': self.lineup,
+                             'number_of_pads': self.num_of_pads,
+                             'starting_positions': self.starting_positions,
+                             'standings': self.standings,
+                             'num_of_rounds': self.num_of_rounds,
+                             'num_of_actions': len(self.actions),
+                             'engine_version': ENGINE_VERSION}).encode()
+        with open(fp, 'wb') as out_file:
+            out_file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            out_file.write(header)
+            # Arrays start on 8 byte boundaries
+            out_file.write(b'\0' * (_aligned(PREAMBLE.size + len(header)) - PREAMBLE.size - len(header)))
+            out_file.write(np.ascontiguousarray(self.turn_orders, dtype=np.uint8).tobytes())
+            out_file.write(b'\0' * (_aligned(self.turn_orders.nbytes) - self.turn_orders.nbytes))
+            out_file.write(np.ascontiguousarray(self.actions).tobytes())
+
+    @classmethod
+    def load(cls, fp, mmap: bool = True) -> 'Replay':
+        with open(fp, 'rb') as in_file:
+            magic, version, header_length = PREAMBLE.unpack(in_file.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f'{fp} is not a replay file')
+            if version != FORMAT_VERSION:
+                raise ValueError(f'Unsupported replay format version {version}')
+            header = json.loads(in_file.read(header_length))
+
+        num_of_cubes = len(header['lineup'])
+        turn_orders_offset = _aligned(PREAMBLE.size + header_length)
+        actions_offset = turn_orders_offset + _aligned(header['num_of_rounds'] * num_of_cubes)
+        shapes = (((header['num_of_rounds'], num_of_cubes), np.uint8, turn_orders_offset),
+                  ((header['num_of_actions'],), record_dtype(num_of_cubes), actions_offset))
+
+        arrays = []
+        for shape, dtype, offset in shapes:
+            if mmap and shape[0] > 0:
+                arrays.append(np.memmap(fp, dtype=dtype, mode='r', offset=offset, shape=shape))
+            else:
+                arrays.append(np.fromfile(fp, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape))
+
+        return cls(header['lineup'], header['number_of_pads'], header['starting_positions'], header['standings'],
+                   *arrays)
@@ -0,0 +1,102 @@
+from typing import Dict, List
+import numpy as np
+from utils.instrumentation import Instrumentation
+
+
+class RaceResults:
+    """Counts of every finishing order seen for a lineup.
+
+    The hot loop only bumps one counter per race, keyed by the finishing order as a tuple of cube indices
+    (winner first). At most n! keys exist, so worker results stay small to send back and cheap to merge.
+    Place and head-to-head statistics are derived from these counts with numpy when asked for.
+    """
+
+    def __init__(self, cube_names: List[str]):
+        self.cube_names = list(cube_names)
+        self.num_of_games = 0
+        self.order_counts: Dict[tuple, int] = {}
+        # Set when the races were played with instrumentation on
+        self.instruments: Instrumentation | None = None
+
+    def record(self, standings: tuple) -> None:
+        self.order_counts[standings] = self.order_counts.get(standings, 0) + 1
+        self.num_of_games += 1
+
+    def add_standings(self, standings: np.ndarray) -> None:
+        # standings[race, place] -> cube index, as returned by the batch engine
+        orders, counts = np.unique(standings, axis=0, return_counts=True)
+        for order, count in zip(map(tuple, orders.tolist()), counts.tolist()):
+            self.order_counts[order] = self.order_counts.get(order, 0) + count
+        self.num_of_games += len(standings)
+
+    def merge(self, other: 'RaceResults') -> 'RaceResults':
+        if other.cube_names != self.cube_names:
+            raise ValueError('Cannot merge results of different lineups')
+        for order, count in other.order_counts.items():
+            self.order_counts[order] = self.order_counts.get(order, 0) + count
+        self.num_of_games += other.num_of_games
+        if other.instruments is not None:
+            if self.instruments is None:
+                self.instruments = Instrumentation(other.instruments.sample_every)
+            self.instruments.merge(other.instruments)
+        return self
+
+    def to_dict(self) -> dict:
+        data = {'cube_names': self.cube_names,
+                'num_of_games': self.num_of_games,
+                'order_counts': [[list(order), count] for order, count in self.order_counts.items()]}
+        if self.instruments is not None:
+            data['instruments'] = self.instruments.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RaceResults':
+        results = cls(data['cube_names'])
+        results.num_of_games = data['num_of_games']
+        results.order_counts = {tuple(order): count for order, count in data['order_counts']}
+        if data.get('instruments') is not None:
+            results.instruments = Instrumentation.from_dict(data['instruments'])
+        return results
+
+    def _orders(self):
+        num_of_cubes = len(self.cube_names)
+        if not self.order_counts:
+            return np.zeros((0, num_of_cubes), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return (np.array(list(self.order_counts.keys()), dtype=np.int64),
+                np.array(list(self.order_counts.values()), dtype=np.int64))
+
+    @property
+    def placements(self) -> np.ndarray:
+        # placements[cube_idx, place] -> number of races that cube finished in that place
+        num_of_cubes = len(self.cube_names)
+        orders, counts = self._orders()
+        placements = np.zeros((num_of_cubes, num_of_cubes), dtype=np.int64)
+        for place in range(num_of_cubes):
+            placements[:, place] = np.bincount(orders[:, place], weights=counts, minlength=num_of_cubes)
+        return placements
+
+    @property
+    def ahead(self) -> np.ndarray:
+        # ahead[a, b] -> number of races cube a finished ahead of cube b
+        num_of_cubes = len(self.cube_names)
+        orders, counts = self._orders()
+        places = np.empty_like(orders)
+        places[np.arange(len(orders))[:, None], orders] = np.arange(num_of_cubes)
+        before = places[:, :, None] < places[:, None, :]
+        return np.einsum('k,kab->ab', counts, before.astype(np.int64))
+
+    @property
+    def placement_probabilities(self) -> np.ndarray:
+        return self.placements / max(self.num_of_games, 1)
+
+    @property
+    def ahead_probabilities(self) -> np.ndarray:
+        return self.ahead / max(self.num_of_games, 1)
+
+    @property
+    def wins(self) -> dict:
+        return {c: int(w) for c, w in zip(self.cube_names, self.placements[:, 0])}
+
+    @property
+    def standings_counts(self) -> dict:
+        return {tuple(self.cube_names[c] for c in order): count for order, count in self.order_counts.items()}
@@ -0,0 +1,34 @@
+import hashlib
+import random
+from typing import List, Tuple
+
+# Races are split into chunks of this size, each chunk draws from its own stream.
+# Changing it changes which races are played for a given seed.
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+def derive_seed(seed: int, *keys) -> int:
+    # Hashing the whole key keeps streams for neighbouring chunks unrelated, and stable across
+    # processes and Python versions (unlike hash())
+    data = ':'.join(str(k) for k in (seed,) + keys).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def chunk_rng(seed: int, chunk_index: int) -> random.Random:
+    return random.Random(derive_seed(seed, chunk_index))
+
+
+def race_seed(seed: int, chunk_index: int, race_index: int) -> int:
+    # Seed of a single race, for runs where every race has to be replayable on its own
+    return derive_seed(seed, chunk_index, race_index)
+
+
+def numpy_chunk_rng(seed: int, chunk_index: int):
+    import numpy as np
+    return np.random.default_rng(derive_seed(seed, chunk_index))
+
+
+def split_into_chunks(number_of_simulations: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    # (chunk_index, simulation_count) covering exactly number_of_simulations races
+    return [(i, min(chunk_size, number_of_simulations - start))
+            for i, start in enumerate(range(0, number_of_simulations, chunk_size))]
@@ -0,0 +1,238 @@
+import asyncio
+import http.client
+import json
+import multiprocessing as mp
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from utils.batch import BatchCubieDerby, validate_race
+from utils.cubes import ENGINE_VERSION
+from utils.rng import derive_seed
+from utils.snapshot import GameState
+
+DEFAULT_PORT = 8765
+DEFAULT_NUM_OF_GAMES = 100_000
+MAX_NUM_OF_GAMES = 10_000_000
+
+
+def normalise_query(query: dict) -> dict:
+    """Checks an odds query and fills in the defaults, equal races give equal queries.
+
+    Either {'state': GameState.to_dict()} for a race in progress, or {'lineup': [...], 'num_of_pads': ...,
+    'starting_positions': {...} or None, 'randomize_order': bool} for a race about to start.
+    'num_of_games' and 'seed' are optional.
+    """
+    num_of_games = int(query.get('num_of_games', DEFAULT_NUM_OF_GAMES))
+    if not 0 < num_of_games <= MAX_NUM_OF_GAMES:
+        raise ValueError(f'num_of_games has to be between 1 and {MAX_NUM_OF_GAMES:,}')
+
+    if query.get('state') is not None:
+        state = GameState.from_dict(query['state'])
+        if state.is_finished:
+            raise ValueError('The race is already over')
+        validate_race(list(state.lineup), state.num_of_pads)
+        state.validate()
+        race = {'state': state.to_dict()}
+    else:
+        lineup = list(query['lineup'])
+        num_of_pads = int(query['num_of_pads'])
+        starting_positions = query.get('starting_positions')
+        if starting_positions is not None:
+            starting_positions = {cube: [int(value) for value in starting_positions[cube]] for cube in lineup}
+        validate_race(lineup, num_of_pads, starting_positions)
+        randomize_order = query.get('randomize_order', True)
+        if not isinstance(randomize_order, bool):
+            raise ValueError(f'randomize_order has to be true or false, not {randomize_order!r}')
+        race = {'lineup': lineup,
+                'num_of_pads': num_of_pads,
+                'starting_positions': starting_positions,
+                'randomize_order': randomize_order}
+
+    return dict(race, num_of_games=num_of_games, seed=int(query.get('seed', 0)))
+
+
+def compute_odds(query: dict) -> dict:
+    # Runs in the worker processes, query is normalised
+    key = json.dumps(query, sort_keys=True)
+    rng = np.random.default_rng(derive_seed(query['seed'], key))
+    if 'state' in query:
+        state = GameState.from_dict(query['state'])
+        race = BatchCubieDerby(list(state.lineup), state.num_of_pads, rng=rng)
+        results = race.play_games(query['num_of_games'], state=state)
+    else:
+        race = BatchCubieDerby(query['lineup'], query['num_of_pads'], query['starting_positions'],
+                               query['randomize_order'], rng=rng)
+        results = race.play_games(query['num_of_games'])
+
+    return {'cube_names': results.cube_names,
+            'num_of_games': results.num_of_games,
+            'wins': {cube: wins / results.num_of_games for cube, wins in results.wins.items()},
+            'placements': results.placement_probabilities.tolist(),
+            'engine_version': ENGINE_VERSION}
+
+
+def _warm_up() -> int:
+    # Imports and first numpy calls happen here, not in the first real query
+    BatchCubieDerby(['Roccia', 'Brant'], 5, rng=np.random.default_rng(0)).play_games(10)
+    return mp.current_process().pid
+
+
+class OddsService:
+    """Answers odds queries over HTTP, on localhost or a Unix socket.
+
+    POST /odds with a JSON query (see `normalise_query`). Answers are kept in an LRU cache, identical queries
+    that arrive while one is being computed share its result, and the simulations run on a pool of worker
+    processes that is started and warmed up once, with the service. If a worker dies the pool can't be used
+    any more, the query that was running gets a 500 and the pool is replaced with a fresh one.
+    """
+
+    def __init__(self, processes: int | None = None, cache_size: int = 1024):
+        self.processes = processes if processes is not None else max(1, mp.cpu_count() - 1)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, dict] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._executor: ProcessPoolExecutor | None = None
+        self.stats = {'queries': 0, 'cache_hits': 0, 'coalesced': 0, 'computed': 0, 'pool_restarts': 0}
+
+    async def start(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, unix_path: str | None = None):
+        await self._start_executor()
+
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def _start_executor(self):
+        # Queries that arrive during the warm up already queue on the new pool
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_up) for _ in range(self.processes)))
+
+    async def _compute(self, query: dict) -> dict:
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, compute_odds, query)
+        except BrokenProcessPool:
+            # Every query on the broken pool ends up here, only the first replaces it
+            if self._executor is executor:
+                self.stats['pool_restarts'] += 1
+                executor.shutdown(wait=False, cancel_futures=True)
+                await self._start_executor()
+            raise
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def odds(self, query: dict) -> dict:
+        query = normalise_query(query)
+        key = json.dumps(query, sort_keys=True)
+        self.stats['queries'] += 1
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return dict(self._cache[key], cached=True)
+
+        if key in self._in_flight:
+            self.stats['coalesced'] += 1
+            return dict(await asyncio.shield(self._in_flight[key]), cached=True)
+
+        future = asyncio.ensure_future(self._compute(query))
+        self._in_flight[key] = future
+        try:
+            result = await future
+        finally:
+            del self._in_flight[key]
+        self.stats['computed'] += 1
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._respond(method, path, body)
+                payload = json.dumps(response).encode()
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\n\r\n'.encode('latin-1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, path: str, body: bytes):
+        if method == 'GET' and path == '/stats':
+            return '200 OK', dict(self.stats, cache_size=len(self._cache), in_flight=len(self._in_flight))
+        if method != 'POST' or path != '/odds':
+            return '404 Not Found', {'error': f'No such endpoint: {method} {path}'}
+
+        start = time.perf_counter()
+        try:
+            query = normalise_query(json.loads(body))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return '400 Bad Request', {'error': str(e) or repr(e)}
+        try:
+            result = await self.odds(query)
+        except Exception as e:
+            # A worker that failed or died, the client still gets an answer
+            return '500 Internal Server Error', {'error': str(e) or repr(e)}
+        return '200 OK', dict(result, elapsed_ms=(time.perf_counter() - start) * 1000)
+
+
+async def serve(host: str = '127.0.0.1', port: int = DEFAULT_PORT, unix_path: str | None = None,
+                processes: int | None = None, cache_size: int = 1024):
+    service = OddsService(processes, cache_size)
+    server = await service.start(host, port, unix_path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def query_odds(query: dict, host: str = '127.0.0.1', port: int = DEFAULT_PORT, unix_path: str | None = None,
+               timeout: float | None = 600) -> dict:
+    """Asks a running OddsService, e.g. query_odds({'lineup': [...], 'num_of_pads': 27})"""
+    if unix_path is not None:
+        connection = _UnixHTTPConnection(unix_path, timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request('POST', '/odds', json.dumps(query), {'Content-Type': 'application/json'})
+        response = json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+    if 'error' in response:
+        raise ValueError(response['error'])
+    return response
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Tuple
+from utils.cubes import ENGINE_VERSION
+from utils.game import CubieDerby
+from utils.parallel import RaceConfig, play_chunk
+from utils.results import RaceResults
+from utils.rng import DEFAULT_CHUNK_SIZE, split_into_chunks
+from utils.sweep import ResultCache, all_lineups, play_lineup
+
+TODO, CLAIMED, DONE = 'todo', 'claimed', 'done'
+
+
+class ShardQueue:
+    """A simulation job split into shards, shared between workers through a directory.
+
+    Every shard is a file that moves from todo/ to claimed/ to done/. Claiming is an atomic rename,
+    so any number of workers on any hosts that see the directory can take shards without a server.
+    Shards are addressed by seed (chunk index or lineup), so which worker plays a shard doesn't change it.
+
+    Two kinds of jobs:
+    - 'race': one lineup, a shard per chunk of races, merged into the same counts `run_simulation` gives.
+    - 'sweep': a shard per lineup played with the batch engine, merged into {lineup: results} like `LineupSweep`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _dir(self, state: str) -> str:
+        return os.path.join(self.directory, state)
+
+    @property
+    def job(self) -> dict:
+        with open(os.path.join(self.directory, 'job.json'), 'r') as f:
+            return json.load(f)
+
+    def _create(self, job: dict, shards: Iterable[Tuple[str, dict]]) -> int:
+        if os.path.exists(os.path.join(self.directory, 'job.json')):
+            raise FileExistsError(f'{self.directory} already holds a job')
+        for state in (TODO, CLAIMED, DONE):
+            os.makedirs(self._dir(state), exist_ok=True)
+
+        count = 0
+        for shard_id, task in shards:
+            _write_atomic(os.path.join(self._dir(TODO), f'{shard_id}.json'), task)
+            count += 1
+        # Written last, workers only start on a complete job
+        _write_atomic(os.path.join(self.directory, 'job.json'), dict(job, engine_version=ENGINE_VERSION))
+        return count
+
+    def create_race_job(self, config: RaceConfig, number_of_simulations: int,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        return self._create({'kind': 'race', 'config': asdict(config), 'chunk_size': chunk_size},
+                            ((f'chunk-{chunk_index:08d}', {'chunk_index': chunk_index, 'count': count})
+                             for chunk_index, count in split_into_chunks(number_of_simulations, chunk_size)))
+
+    def create_sweep_job(self, lineups: Iterable[Tuple[str, ...]], num_of_pads: int,
+                         layout: List[List[int]] | None = None, num_of_games: int = 100_000,
+                         seed: int = 0) -> int:
+        def key(lineup):
+            starting_positions = ({cube: list(position) for cube, position in zip(lineup, layout)}
+                                  if layout is not None else None)
+            return ResultCache.make_key(tuple(lineup), num_of_pads, starting_positions, num_of_games, seed)
+
+        return self._create({'kind': 'sweep'},
+                            ((f'lineup-{i:05d}', {'key': key(lineup)}) for i, lineup in enumerate(lineups)))
+
+    def _shards(self, state: str) -> List[str]:
+        # Shard files in a state directory, claimed ones carry @worker after .json. Leaves out the .tmp files
+        # a worker that crashed in _write_atomic left behind, they may be half written.
+        return sorted(name for name in os.listdir(self._dir(state)) if name.split('@', 1)[0].endswith('.json'))
+
+    def claim(self, worker_id: str) -> Tuple[str, dict] | None:
+        for name in self._shards(TODO):
+            todo = os.path.join(self._dir(TODO), name)
+            claimed = os.path.join(self._dir(CLAIMED), f'{name}@{worker_id}')
+            try:
+                # The claim time, for requeue_stale. Set before the rename (which keeps it), so a claimed
+                # shard never shows the time it was queued
+                os.utime(todo)
+                os.rename(todo, claimed)
+            except FileNotFoundError:
+                # Another worker was faster
+                continue
+            with open(claimed, 'r') as f:
+                return claimed, json.load(f)
+        return None
+
+    def work(self, worker_id: str | None = None, max_shards: int | None = None) -> int:
+        """Plays shards until there are none left to claim, returns how many this worker played."""
+        job = self.job
+        if job['engine_version'] != ENGINE_VERSION:
+            raise ValueError(f'Job is for engine version {job["engine_version"]}, this is version {ENGINE_VERSION}')
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        race = None
+        if job['kind'] == 'race':
+            config = RaceConfig(**job['config'])
+            race = CubieDerby(config.cubes, config.num_of_pads, config.starting_positions, config.randomize_order)
+
+        played = 0
+        while max_shards is None or played < max_shards:
+            claim = self.claim(worker_id)
+            if claim is None:
+                break
+            claimed, task = claim
+            name = os.path.basename(claimed)[:-len(worker_id) - 1]
+
+            if job['kind'] == 'race':
+                entry = {'results': play_chunk(race, config.seed, task['chunk_index'], task['count']).to_dict()}
+            else:
+                _, results = play_lineup(task['key'])
+                entry = {'key': task['key'], 'results': results.to_dict()}
+            _write_atomic(os.path.join(self._dir(DONE), name), dict(entry, worker=worker_id))
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                # Requeued as stale while it was being played, whoever plays it again writes the same result
+                pass
+            played += 1
+        return played
+
+    def requeue_stale(self, max_age: float) -> int:
+        # Puts back shards claimed more than max_age seconds ago by workers that never finished them,
+        # and removes temporary files as old as that, left by writes that never completed
+        requeued = 0
+        now = time.time()
+        for state in (TODO, DONE):
+            for name in os.listdir(self._dir(state)):
+                path = os.path.join(self._dir(state), name)
+                try:
+                    if name.endswith('.tmp') and now - os.path.getmtime(path) > max_age:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+        for name in self._shards(CLAIMED):
+            path = os.path.join(self._dir(CLAIMED), name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.rename(path, os.path.join(self._dir(TODO), name.split('@', 1)[0]))
+                    requeued += 1
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def status(self) -> Dict[str, int]:
+        return {state: len(self._shards(state)) for state in (TODO, CLAIMED, DONE)}
+
+    def merge(self, cache_directory: str | None = None):
+        """RaceResults of a race job, {lineup: RaceResults} of a sweep job.
+
+        Lineups of a sweep are also stored in a ResultCache, in cache_directory or the job's own cache/ directory.
+        """
+        job = self.job
+        status = self.status()
+        if status[TODO] or status[CLAIMED]:
+            raise RuntimeError(f'Job isn\'t finished: {status[TODO]} shards to do, {status[CLAIMED]} running')
+
+        entries = []
+        for name in self._shards(DONE):
+            with open(os.path.join(self._dir(DONE), name), 'r') as f:
+                entries.append(json.load(f))
+
+        if job['kind'] == 'race':
+            results = RaceResults(job['config']['cubes'])
+            for entry in entries:
+                results.merge(RaceResults.from_dict(entry['results']))
+            return results
+
+        cache = ResultCache(cache_directory if cache_directory is not None else os.path.join(self.directory, 'cache'))
+        results = {}
+        for entry in entries:
+            lineup_results = RaceResults.from_dict(entry['results'])
+            cache.put(entry['key'], lineup_results)
+            results[tuple(entry['key']['lineup'])] = lineup_results
+        return results
+
+
+def _write_atomic(path: str, data: dict):
+    tmp_path = f'{path}.{socket.gethostname()}-{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m utils.shards',
+                                     description='Shard a simulation over a shared directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    race = commands.add_parser('race', help='create a job for one lineup')
+    race.add_argument('directory')
+    race.add_argument('--cubes', nargs='+', required=True)
+    race.add_argument('--pads', type=int, required=True)
+    race.add_argument('--starting-positions', type=json.loads, default=None,
+                      help='JSON, e.g. \'{"Roccia": [0, 0], "Brant": [1, 0]}\'')
+    race.add_argument('--simulations', type=int, required=True)
+    race.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    race.add_argument('--seed', type=int, default=0)
+
+    sweep = commands.add_parser('sweep', help='create a job for every combination of cubes')
+    sweep.add_argument('directory')
+    sweep.add_argument('--num-of-cubes', type=int, required=True)
+    sweep.add_argument('--pads', type=int, required=True)
+    sweep.add_argument('--layout', type=json.loads, default=None, help='JSON, [position, stack_order] per slot')
+    sweep.add_argument('--simulations', type=int, default=100_000)
+    sweep.add_argument('--seed', type=int, default=0)
+
+    for name, help_text in (('work', 'play shards until none are left'), ('merge', 'combine the finished shards'),
+                            ('status', 'count shards to do, running and done')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('directory')
+    commands.choices['work'].add_argument('--requeue-after', type=float, default=None,
+                                          help='first put back shards claimed more than this many seconds ago')
+    commands.choices['merge'].add_argument('--output', default=None, help='write the merged results as JSON')
+    commands.choices['merge'].add_argument('--cache-dir', default=None,
+                                           help='sweep cache to store the lineups in, default <directory>/cache')
+
+    args = parser.parse_args(argv)
+    queue = ShardQueue(args.directory)
+
+    if args.command == 'race':
+        config = RaceConfig(args.cubes, args.pads, args.starting_positions, seed=args.seed)
+        print(f'Created {queue.create_race_job(config, args.simulations, args.chunk_size)} shards')
+    elif args.command == 'sweep':
+        count = queue.create_sweep_job(all_lineups(args.num_of_cubes), args.pads, args.layout,
+                                       args.simulations, args.seed)
+        print(f'Created {count} shards')
+    elif args.command == 'work':
+        if args.requeue_after is not None:
+            queue.requeue_stale(args.requeue_after)
+        print(f'Played {queue.work()} shards')
+    elif args.command == 'status':
+        print(queue.status())
+    elif args.command == 'merge':
+        results = queue.merge(args.cache_dir)
+        if isinstance(results, RaceResults):
+            output = results.to_dict()
+            for cube, wins in sorted(results.wins.items(), key=lambda item: item[1], reverse=True):
+                print(f'{cube} ({wins / results.num_of_games * 100:4.2f}%)')
+        else:
+            output = [{'lineup': list(lineup), 'results': r.to_dict()} for lineup, r in results.items()]
+            print(f'Merged {len(results)} lineups into the sweep cache')
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                json.dump(output, f)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
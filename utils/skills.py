@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+
+# When a skill is checked during a turn
+BEFORE_MOVE = 'before_move'     # after the roll, adds to the pads moved
+STACK = 'stack'                 # when the moving stack is picked
+MOVE = 'move'                   # while the stack moves or lands
+AFTER_MOVE = 'after_move'       # once the stack has landed
+ARRIVAL = 'arrival'             # on another cube's turn, when a stack lands on the skill cube's pad
+
+# Conditions of BEFORE_MOVE skills, None means every turn
+FIRST_TO_MOVE = 'first_to_move'
+LAST_TO_MOVE = 'last_to_move'
+LAST_PLACE = 'last_place'
+
+# Effects of BEFORE_MOVE skills: `bonus` extra pads, or the die roll once more
+EXTRA_MOVES = 'extra_moves'
+REPEAT_ROLL = 'repeat_roll'
+
+
+@dataclass(frozen=True)
+class Skill:
+    """The rules of one cube, shared by the scalar and batch engines and the exact solver.
+
+    Skills in the BEFORE_MOVE phase are built by every engine from `condition`, `chance` and `effect` alone,
+    so a cube with one of those (or just its own die) is added here and nowhere else. The other phases change
+    the board or carry state between turns, their effects are written out in each engine (the Cube subclasses,
+    BatchCubieDerby._play_batch and ExactSolver._turn_outcomes) and only named here.
+    """
+    description: str
+    die_faces: tuple = (1, 2, 3)
+    phase: str | None = None
+    chance: float = 1.0
+    bonus: int = 0
+    condition: str | None = None
+    effect: str | None = None
+
+
+SKILLS = {
+    'Roccia': Skill('Last to move (+2)', phase=BEFORE_MOVE, bonus=2, condition=LAST_TO_MOVE, effect=EXTRA_MOVES),
+    'Brant': Skill('First to move (+2)', phase=BEFORE_MOVE, bonus=2, condition=FIRST_TO_MOVE, effect=EXTRA_MOVES),
+    'Phoebe': Skill('50% chance for extra (+1)', phase=BEFORE_MOVE, chance=0.5, bonus=1, effect=EXTRA_MOVES),
+    'Zani': Skill('Stacked move, next turn (+2)', die_faces=(1, 3), phase=MOVE, chance=0.4, bonus=2,
+                  effect='extra_moves_next_turn'),
+    'Cartethyia': Skill('Ranked last, permanent (+2)', phase=AFTER_MOVE, chance=0.6, bonus=2,
+                        effect='extra_moves_every_turn'),
+    'Cantarella': Skill('Carrying passed cubes forward', phase=MOVE, effect='carry_passed_cubes'),
+    'Jinhsi': Skill('Cubes above, 40% chance to move to top', phase=ARRIVAL, chance=0.4, effect='jump_to_top'),
+    'Changli': Skill('Cubes below, 65% chance to move last next turn', phase=MOVE, chance=0.65,
+                     effect='move_last_next_round'),
+    'Calcharo': Skill('Last place (+3)', phase=BEFORE_MOVE, bonus=3, condition=LAST_PLACE, effect=EXTRA_MOVES),
+    'Shorekeeper': Skill('Rolls only 2 or 3', die_faces=(2, 3)),
+    'Camellya': Skill('50% chance to get +1 per cube on same pad', phase=STACK, chance=0.5,
+                      effect='leave_stack_behind'),
+    'Carlotta': Skill('28% chance to move twice', phase=BEFORE_MOVE, chance=0.28, effect=REPEAT_ROLL),
+}
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import List, Tuple
+from utils.recorder import ActionRecorder
+from utils.skills import SKILLS
+
+# Stack orders only keep cubes of a pad in order and can have gaps (a cube jumping off a stack, like Jinhsi,
+# leaves one), so they aren't capped by the number of cubes. The batch engine needs them below this.
+MAX_STACK_ORDER = 1 << 9
+
+
+@dataclass(frozen=True)
+class GameState:
+    """Everything that decides how a race goes on from a given point, cubes are referred to by lineup index.
+
+    Frozen and made of tuples, so states can be compared, hashed and used as cache keys.
+    """
+    lineup: Tuple[str, ...]
+    num_of_pads: int
+    # (position, stack_order) per cube
+    positions: Tuple[Tuple[int, int], ...]
+    # Skill state carried between turns: Cantarella's carry used, Zani's pending and Cartethyia's permanent bonus
+    skill_activated: Tuple[bool, ...]
+    extra_moves: Tuple[int, ...]
+    # Turn order of the current round and the index in it of the next cube to move,
+    # len(turn_order) once the round is over
+    turn_order: Tuple[int, ...]
+    next_turn: int
+    # Changli, if her skill triggered this round
+    moves_last_next_round: int | None = None
+    is_finished: bool = False
+
+    def validate(self) -> None:
+        # Raises ValueError if the state can't come from a race with this lineup, e.g. one received over the network
+        num_of_cubes = len(self.lineup)
+        if not (len(self.positions) == len(self.skill_activated) == len(self.extra_moves) == num_of_cubes):
+            raise ValueError('The state needs a position and skill state for every cube of the lineup')
+        if sorted(self.turn_order) != list(range(num_of_cubes)):
+            raise ValueError('The turn order has to hold every cube of the lineup once')
+        if not 0 <= self.next_turn <= num_of_cubes:
+            raise ValueError(f'next_turn has to be between 0 and {num_of_cubes}')
+        if self.moves_last_next_round is not None and not 0 <= self.moves_last_next_round < num_of_cubes:
+            raise ValueError('moves_last_next_round has to be a lineup index')
+        places = set()
+        for position, stack_order in self.positions:
+            if not 0 <= position < self.num_of_pads:
+                raise ValueError(f'Position off the track: {[position, stack_order]}')
+            if not 0 <= stack_order < MAX_STACK_ORDER:
+                raise ValueError(f'Stack order has to be between 0 and {MAX_STACK_ORDER - 1}: '
+                                 f'{[position, stack_order]}')
+            places.add((position, stack_order))
+        if len(places) != num_of_cubes:
+            raise ValueError('Two cubes are in the same place')
+
+    @classmethod
+    def from_game_data(cls, data: dict, round_index: int, action_index: int,
+                       lineup: List[str] | None = None) -> 'GameState':
+        """State right after the given action of a recorded game (get_game_data, JSON or replay files).
+
+        Recorded games don't keep the lineup order, the order of the starting positions is used unless given.
+        The skill state isn't recorded either, it's worked out from which skills triggered up to that action.
+        """
+        lineup = tuple(lineup if lineup is not None else data['starting_positions'])
+        index = {cube: i for i, cube in enumerate(lineup)}
+        state = ActionRecorder.from_game_data(data).state_at(round_index, action_index)
+
+        skill_activated = [False] * len(lineup)
+        extra_moves = [0] * len(lineup)
+        moves_last_next_round = None
+        for r in range(round_index + 1):
+            actions = data['rounds'][r]['actions']
+            for action in actions[:action_index + 1] if r == round_index else actions:
+                cube = action['cube_name']
+                triggered = 'skill_activated' in action
+                if cube == 'Zani':
+                    # Pending until her next move
+                    skill_activated[index[cube]] = triggered
+                    extra_moves[index[cube]] = SKILLS[cube].bonus if triggered else 0
+                elif triggered and cube == 'Cartethyia':
+                    skill_activated[index[cube]] = True
+                    extra_moves[index[cube]] = SKILLS[cube].bonus
+                elif triggered and cube == 'Cantarella':
+                    skill_activated[index[cube]] = True
+                elif triggered and cube == 'Changli' and r == round_index:
+                    moves_last_next_round = index[cube]
+
+        last_position = max(position for position, _ in state.values())
+        return cls(lineup=lineup,
+                   num_of_pads=data['number_of_pads'],
+                   positions=tuple(tuple(state[cube]) for cube in lineup),
+                   skill_activated=tuple(skill_activated),
+                   extra_moves=tuple(extra_moves),
+                   turn_order=tuple(index[cube] for cube in data['rounds'][round_index]['turn_order']),
+                   next_turn=action_index + 1,
+                   moves_last_next_round=moves_last_next_round,
+                   is_finished=last_position + 1 >= data['number_of_pads'])
+
+    def to_dict(self) -> dict:
+        return {'lineup': list(self.lineup),
+                'num_of_pads': self.num_of_pads,
+                'positions': [list(position) for position in self.positions],
+                'skill_activated': list(self.skill_activated),
+                'extra_moves': list(self.extra_moves),
+                'turn_order': list(self.turn_order),
+                'next_turn': self.next_turn,
+                'moves_last_next_round': self.moves_last_next_round,
+                'is_finished': self.is_finished}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'GameState':
+        return cls(lineup=tuple(data['lineup']),
+                   num_of_pads=data['num_of_pads'],
+                   positions=tuple(tuple(position) for position in data['positions']),
+                   skill_activated=tuple(data['skill_activated']),
+                   extra_moves=tuple(data['extra_moves']),
+                   turn_order=tuple(data['turn_order']),
+                   next_turn=data['next_turn'],
+                   moves_last_next_round=data.get('moves_last_next_round'),
+                   is_finished=data.get('is_finished', False))
@@ -0,0 +1,315 @@
+from collections import defaultdict
+from itertools import permutations
+from typing import List
+import numpy as np
+from utils.cubes import ENGINE_VERSION
+from utils.skills import BEFORE_MOVE, FIRST_TO_MOVE, LAST_PLACE, LAST_TO_MOVE, REPEAT_ROLL, SKILLS
+from utils.sweep import ResultCache
+
+
+class ExactResults:
+    def __init__(self, cube_names: List[str], outcomes: List[tuple], probabilities: np.ndarray):
+        self.cube_names = list(cube_names)
+        num_of_cubes = len(self.cube_names)
+
+        self.standings_probabilities = {}
+        # placements[cube_idx, place] -> probability of that cube finishing in that place
+        self.placements = np.zeros((num_of_cubes, num_of_cubes))
+        for outcome, p in zip(outcomes, probabilities.tolist()):
+            if p > 0:
+                self.standings_probabilities[tuple(self.cube_names[c] for c in outcome)] = p
+            for place, cube_idx in enumerate(outcome):
+                self.placements[cube_idx, place] += p
+
+    @property
+    def wins(self) -> dict:
+        return {c: float(p) for c, p in zip(self.cube_names, self.placements[:, 0])}
+
+    def to_dict(self) -> dict:
+        return {'cube_names': self.cube_names,
+                'standings_probabilities': [[list(standings), p]
+                                            for standings, p in self.standings_probabilities.items()]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ExactResults':
+        idx = {cube: i for i, cube in enumerate(data['cube_names'])}
+        outcomes = [tuple(idx[cube] for cube in standings) for standings, _ in data['standings_probabilities']]
+        probabilities = np.array([p for _, p in data['standings_probabilities']])
+        return cls(data['cube_names'], outcomes, probabilities)
+
+
+class ExactSolver:
+    """Computes the exact finishing order distribution of a race without sampling.
+
+    Probability mass is pushed forward through every reachable board state. States are merged when the
+    same board is reached in different ways, and processed in order of total progress, so each one is only
+    expanded once. Turn orders are drawn one cube at a time, which is the same as shuffling at the start
+    of the round but keeps far fewer states around. The state space grows quickly with the number of
+    cubes, this is meant for 4-cube lineups.
+    Solved races are kept for the solver's lifetime, and with a `cache` on disk for later runs as well.
+    """
+
+    def __init__(self, cubes: List[str], num_of_pads: int, cache: ResultCache | None = None):
+        for cube in cubes:
+            if cube not in SKILLS:
+                raise KeyError(cube)
+
+        self.cube_names = list(cubes)
+        self.num_of_pads = num_of_pads
+        self.num_of_cubes = len(self.cube_names)
+        self.num_of_states = 0
+        self.cache = cache
+
+        self._skills = [SKILLS[cube] for cube in self.cube_names]
+        # Per cube: whether it has a BEFORE_MOVE skill, and whether that one cares about the turn order
+        self._before_move = [skill.phase == BEFORE_MOVE for skill in self._skills]
+        self._turn_dependent = [skill.phase == BEFORE_MOVE and skill.condition in (FIRST_TO_MOVE, LAST_TO_MOVE)
+                                for skill in self._skills]
+        self._idx = {cube: (self.cube_names.index(cube) if cube in self.cube_names else -1)
+                     for cube in SKILLS}
+
+        self._outcomes = list(permutations(range(self.num_of_cubes)))
+        self._outcome_index = {outcome: i for i, outcome in enumerate(self._outcomes)}
+
+        # Solved starting layouts
+        self._cache = {}
+
+    def solve(self, starting_positions: dict = None, randomize_order: bool = True) -> ExactResults:
+        cache_key = (tuple(tuple(starting_positions[cube]) for cube in self.cube_names)
+                     if starting_positions is not None else None, randomize_order)
+        if cache_key not in self._cache:
+            results = None
+            if self.cache is not None:
+                disk_key = self.cache_key(starting_positions, randomize_order)
+                results = self.cache.get(disk_key, ExactResults)
+            if results is None:
+                results = ExactResults(self.cube_names, self._outcomes,
+                                       self._propagate(starting_positions, randomize_order))
+                if self.cache is not None:
+                    self.cache.put(disk_key, results)
+            self._cache[cache_key] = results
+        return self._cache[cache_key]
+
+    def cache_key(self, starting_positions: dict | None, randomize_order: bool = True) -> dict:
+        # Key of a solved race in a ResultCache, 'solver' keeps it apart from the simulated entries
+        return {'solver': 'exact',
+                'lineup': self.cube_names,
+                'num_of_pads': self.num_of_pads,
+                'starting_positions': ({cube: list(starting_positions[cube]) for cube in self.cube_names}
+                                       if starting_positions is not None else None),
+                'randomize_order': randomize_order,
+                'engine_version': ENGINE_VERSION}
+
+    def _initial_states(self, starting_positions: dict | None, randomize_order: bool):
+        # States are (positions, stack orders, cubes yet to move this round, fixed turn order,
+        # Changli forced last this round, flags)
+        num_of_cubes = self.num_of_cubes
+        all_cubes = tuple(range(num_of_cubes))
+        flags = (False, False, False, False)
+
+        if starting_positions is not None:
+            positions = tuple(starting_positions[cube][0] for cube in self.cube_names)
+            stack_orders = self._canonical_orders(positions,
+                                                  tuple(starting_positions[cube][1] for cube in self.cube_names))
+            return [(1.0, (positions, stack_orders, all_cubes, not randomize_order, False, flags))]
+
+        # Stack everyone on the starting pad, the first to move is on top
+        first_orders = list(permutations(all_cubes)) if randomize_order else [all_cubes]
+        states = []
+        for turn_order in first_orders:
+            orders = [0] * num_of_cubes
+            for turn, cube_idx in enumerate(turn_order):
+                orders[cube_idx] = num_of_cubes - 1 - turn
+            states.append((1 / len(first_orders), ((0,) * num_of_cubes, tuple(orders), turn_order, True, False, flags)))
+        return states
+
+    def _propagate(self, starting_positions: dict | None, randomize_order: bool) -> np.ndarray:
+        value = np.zeros(len(self._outcomes))
+
+        # Every turn moves at least one pad forward, so states grouped by progress are never revisited
+        buckets = defaultdict(lambda: defaultdict(float))
+        for p, state in self._initial_states(starting_positions, randomize_order):
+            buckets[self._progress(state)][state] += p
+
+        # Outcomes of a cube's turn don't depend on who is left to move, they are shared between those states
+        # and dropped once the whole field is past them
+        turn_cache = defaultdict(dict)
+
+        while buckets:
+            progress = min(buckets)
+            states = buckets.pop(progress)
+            for old_progress in [k for k in turn_cache if k < progress // (self.num_of_cubes + 1)]:
+                del turn_cache[old_progress]
+
+            self.num_of_states += len(states)
+            for state, p in states.items():
+                for q, next_state in self._transitions(state, turn_cache[sum(state[0])]):
+                    if isinstance(next_state, int):
+                        value[next_state] += p * q
+                    else:
+                        buckets[self._progress(next_state)][next_state] += p * q
+
+        return value
+
+    def _progress(self, state: tuple) -> int:
+        return sum(state[0]) * (self.num_of_cubes + 1) + self.num_of_cubes - len(state[2])
+
+    @staticmethod
+    def _canonical_orders(positions: tuple, stack_orders: tuple) -> tuple:
+        # Only the order within a pad matters, Cartethyia's bottom check happens right after her own move
+        return tuple(sum(1 for d in range(len(positions))
+                         if positions[d] == positions[c] and stack_orders[d] < stack_orders[c])
+                     for c in range(len(positions)))
+
+    def _transitions(self, state: tuple, turn_cache: dict):
+        # Yields (probability, next state) or (probability, finishing order index) once a cube reaches the end
+        positions, stack_orders, remaining, fixed_order, changli_forced, flags = state
+        num_of_cubes = self.num_of_cubes
+
+        if fixed_order:
+            movers = remaining[:1]
+        elif changli_forced and len(remaining) > 1:
+            movers = tuple(c for c in remaining if c != self._idx['Changli'])
+        else:
+            movers = remaining
+
+        turn = num_of_cubes - len(remaining)
+        for mover in movers:
+            p_mover = 1 / len(movers)
+            rest = tuple(c for c in remaining if c != mover)
+
+            # Only skills of the first or last to move care about the place in the turn order
+            key = (positions, stack_orders, mover, turn if self._turn_dependent[mover] else -1, flags)
+            outcomes = turn_cache.get(key)
+            if outcomes is None:
+                outcomes = turn_cache[key] = self._board_outcomes(positions, stack_orders, mover, turn, flags)
+
+            for p, board in outcomes:
+                if isinstance(board, int):
+                    yield p_mover * p, board
+                elif rest:
+                    yield p_mover * p, board[:2] + (rest, fixed_order, changli_forced, board[2])
+                else:
+                    # New round, Changli moves last if her skill triggered
+                    new_positions, new_orders, new_flags = board
+                    yield p_mover * p, (new_positions, new_orders, tuple(range(num_of_cubes)), False,
+                                        new_flags[3], new_flags[:3] + (False,))
+
+    def _board_outcomes(self, positions: tuple, stack_orders: tuple, mover: int, turn: int, flags: tuple) -> list:
+        # (probability, (positions, stack orders, flags)) after the turn, or the finishing order index
+        boards = defaultdict(float)
+        for p, new_positions, new_orders, new_flags in self._turn_outcomes(positions, stack_orders, mover,
+                                                                            turn, flags):
+            if new_positions[mover] + 1 >= self.num_of_pads:
+                standings = sorted(range(self.num_of_cubes), key=lambda c: (-new_positions[c], -new_orders[c]))
+                boards[self._outcome_index[tuple(standings)]] += p
+            else:
+                boards[(new_positions, self._canonical_orders(new_positions, new_orders), new_flags)] += p
+        return [(p, board) for board, p in boards.items()]
+
+    def _turn_outcomes(self, positions: tuple, stack_orders: tuple, mover: int, turn: int, flags: tuple):
+        # flags: (zani_pending, cartethyia_active, cantarella_used, changli_last_next_round)
+        idx, skills = self._idx, self._skills
+        num_of_cubes = self.num_of_cubes
+        zani_pending, cartethyia_active, cantarella_used, changli_last = flags
+
+        skill = skills[mover]
+        mover_pos, mover_order = positions[mover], stack_orders[mover]
+        p_face = 1 / len(skill.die_faces)
+
+        # The condition of a BEFORE_MOVE skill, the same for every roll
+        if skill.condition == FIRST_TO_MOVE:
+            holds = turn == 0
+        elif skill.condition == LAST_TO_MOVE:
+            holds = turn == num_of_cubes - 1
+        elif skill.condition == LAST_PLACE:
+            holds = min(range(num_of_cubes), key=lambda c: (positions[c], stack_orders[c])) == mover
+        else:
+            holds = True
+
+        for die in skill.die_faces:
+            # Skills applied before moving, as (probability, extra pads)
+            if self._before_move[mover]:
+                extra = die if skill.effect == REPEAT_ROLL else skill.bonus
+                if not holds:
+                    before = [(1.0, 0)]
+                elif skill.chance < 1.0:
+                    before = [(skill.chance, extra), (1 - skill.chance, 0)]
+                else:
+                    before = [(1.0, extra)]
+            elif mover == idx['Zani'] and zani_pending:
+                before = [(1.0, skill.bonus)]
+            elif mover == idx['Cartethyia'] and cartethyia_active:
+                before = [(1.0, skill.bonus)]
+            else:
+                before = [(1.0, 0)]
+
+            for p_before, extra in before:
+                p = p_face * p_before
+                new_pos = min(mover_pos + die + extra, self.num_of_pads - 1)
+
+                stack = [c for c in range(num_of_cubes) if positions[c] == mover_pos]
+                moving_stack = sorted([c for c in stack if stack_orders[c] >= mover_order],
+                                      key=lambda c: stack_orders[c])
+
+                # (probability, target pad, moving stack, stack orders before moving)
+                moves = []
+                if mover == idx['Camellya'] and len(stack) > 1:
+                    orders = [o - 1 if positions[c] == mover_pos and o > mover_order else o
+                              for c, o in enumerate(stack_orders)]
+                    moves.append((skill.chance, new_pos + len(stack) - 1, [mover], orders))
+                    moves.append((1 - skill.chance, new_pos, moving_stack, list(stack_orders)))
+                else:
+                    moves.append((1.0, new_pos, moving_stack, list(stack_orders)))
+
+                new_flags = [zani_pending, cartethyia_active, cantarella_used, changli_last]
+                if mover == idx['Cantarella'] and not cantarella_used:
+                    passed = sorted([c for c in range(num_of_cubes) if mover_pos < positions[c] < new_pos],
+                                    key=lambda c: (-positions[c], stack_orders[c]))
+                    if passed:
+                        moves = [(p_move, target, passed + stack, orders) for p_move, target, stack, orders in moves]
+                        new_flags[2] = True
+
+                for p_move, target, moving, orders in moves:
+                    for p_after, new_positions, new_orders, after_flags in self._move_outcomes(
+                            positions, orders, mover, moving, target, new_flags):
+                        yield p * p_move * p_after, new_positions, new_orders, after_flags
+
+    def _move_outcomes(self, positions: tuple, stack_orders: list, mover: int, moving: list, target: int,
+                       flags: list):
+        idx, skill = self._idx, self._skills[mover]
+        target_stack = [c for c in range(self.num_of_cubes) if positions[c] == target and c not in moving]
+
+        # Jinhsi jumps to the top of the arriving stack
+        jinhsi = idx['Jinhsi']
+        if jinhsi in target_stack:
+            chance = SKILLS['Jinhsi'].chance
+            arrivals = [(chance, [c for c in target_stack if c != jinhsi], moving + [jinhsi]),
+                        (1 - chance, target_stack, moving)]
+        else:
+            arrivals = [(1.0, target_stack, moving)]
+
+        for p_arrival, target_stack, moving_stack in arrivals:
+            max_stack_order = (max(stack_orders[c] for c in target_stack) + 1) if target_stack else 0
+            new_positions, new_orders = list(positions), list(stack_orders)
+            for i, c in enumerate(moving_stack):
+                new_positions[c] = target
+                new_orders[c] = max_stack_order + i
+            new_positions, new_orders = tuple(new_positions), tuple(new_orders)
+
+            # Skills applied after moving, as (probability, flags)
+            after = [(p_arrival, list(flags))]
+            if mover == idx['Changli'] and max_stack_order > 0:
+                after = [(p * c, f[:3] + [last]) for p, f in after
+                         for c, last in ((skill.chance, True), (1 - skill.chance, f[3]))]
+            elif mover == idx['Zani']:
+                pending = [(skill.chance, True), (1 - skill.chance, False)] \
+                    if len(moving_stack) > 1 else [(1.0, False)]
+                after = [(p * c, [z] + f[1:]) for p, f in after for c, z in pending]
+            elif (mover == idx['Cartethyia'] and not flags[1] and new_orders[mover] == 0
+                  and new_positions[mover] == min(new_positions)):
+                after = [(p * c, f[:1] + [active] + f[2:]) for p, f in after
+                         for c, active in ((skill.chance, True), (1 - skill.chance, False))]
+
+            for p, f in after:
+                yield p, new_positions, new_orders, tuple(f)
@@ -0,0 +1,110 @@
+import math
+from itertools import permutations
+from typing import List
+import numpy as np
+from utils.batch import BatchCubieDerby
+from utils.results import RaceResults
+
+
+class StratifiedResults:
+    """Results of races sampled per first turn order (stratum), combined with the stratum weights.
+
+    Every first turn order is equally likely, so each stratum weighs 1 / n!. The estimates don't depend on
+    how many races each stratum got, and their variance only has the spread within the strata in it.
+    """
+
+    def __init__(self, cube_names: List[str], turn_orders: List[tuple], strata: List[RaceResults]):
+        self.cube_names = list(cube_names)
+        self.turn_orders = turn_orders
+        self.strata = strata
+        self.weights = np.full(len(strata), 1 / len(strata))
+
+    @property
+    def num_of_games(self) -> int:
+        return sum(results.num_of_games for results in self.strata)
+
+    @property
+    def placement_probabilities(self) -> np.ndarray:
+        return sum(w * results.placement_probabilities for w, results in zip(self.weights, self.strata))
+
+    @property
+    def win_probabilities(self) -> dict:
+        return {c: float(p) for c, p in zip(self.cube_names, self.placement_probabilities[:, 0])}
+
+    @property
+    def win_standard_errors(self) -> dict:
+        # sqrt(sum_h w_h^2 s_h^2 / n_h) per cube, s_h^2 the sample variance of winning in stratum h
+        variance = np.zeros(len(self.cube_names))
+        for w, results in zip(self.weights, self.strata):
+            n = results.num_of_games
+            p = results.placement_probabilities[:, 0]
+            variance += w * w * p * (1 - p) / max(n - 1, 1)
+        return {c: float(math.sqrt(v)) for c, v in zip(self.cube_names, variance)}
+
+    @property
+    def plain_standard_errors(self) -> dict:
+        # What plain Monte Carlo with the same number of races would get
+        n = self.num_of_games
+        return {c: math.sqrt(p * (1 - p) / n) for c, p in self.win_probabilities.items()}
+
+    @property
+    def variance_reduction(self) -> dict:
+        # Plain Monte Carlo variance over stratified variance, how many times the races plain sampling needs
+        stratified, plain = self.win_standard_errors, self.plain_standard_errors
+        return {c: (plain[c] / stratified[c]) ** 2 if stratified[c] > 0 else math.inf for c in self.cube_names}
+
+
+def _allocate(total: int, shares: np.ndarray) -> np.ndarray:
+    # Whole numbers of races proportional to shares, adding up to total
+    exact = shares / shares.sum() * total
+    counts = np.floor(exact).astype(np.int64)
+    counts[np.argsort(counts - exact)[:total - counts.sum()]] += 1
+    return counts
+
+
+def _turn_order_rows(turn_orders: List[tuple], counts: np.ndarray) -> np.ndarray:
+    return np.repeat(np.array(turn_orders, dtype=np.int32), counts, axis=0)
+
+
+def play_stratified(cubes: List[str],
+                    num_of_pads: int,
+                    num_of_games: int,
+                    starting_positions: dict = None,
+                    allocation: str = 'proportional',
+                    pilot_fraction: float = 0.1,
+                    rng: np.random.Generator | None = None) -> StratifiedResults:
+    """Plays num_of_games races with the batch engine, sampling every first turn order on purpose.
+
+    'proportional' gives every stratum the same number of races. 'neyman' first plays pilot_fraction of the
+    races evenly, then hands out the rest in proportion to each stratum's spread in who wins, which puts the
+    races where the outcome is least settled. Turn orders after the first round are shuffled as usual.
+    """
+    if allocation not in ('proportional', 'neyman'):
+        raise ValueError(f'Unknown allocation: {allocation}, use "proportional" or "neyman"')
+
+    race = BatchCubieDerby(cubes, num_of_pads, starting_positions, rng=rng)
+    turn_orders = list(permutations(range(len(cubes))))
+    num_of_strata = len(turn_orders)
+    if num_of_games < 2 * num_of_strata:
+        raise ValueError(f'Needs at least two races per turn order, {2 * num_of_strata:,} races')
+
+    strata = [RaceResults(cubes) for _ in turn_orders]
+
+    def play(counts):
+        standings = race.play_turn_orders(_turn_order_rows(turn_orders, counts))
+        for stratum, end, count in zip(strata, np.cumsum(counts), counts):
+            if count:
+                stratum.add_standings(standings[end - count:end])
+
+    if allocation == 'proportional':
+        play(_allocate(num_of_games, np.ones(num_of_strata)))
+    else:
+        pilot = max(2 * num_of_strata, int(num_of_games * pilot_fraction))
+        play(_allocate(pilot, np.ones(num_of_strata)))
+        # Spread of the win indicators of all cubes, a stratum that always has the same winner gets few races
+        spread = np.array([math.sqrt(np.sum(p * (1 - p)))
+                           for p in (results.placement_probabilities[:, 0] for results in strata)])
+        # Every stratum keeps some races, so a pilot that saw no variation can still be corrected
+        play(_allocate(num_of_games - pilot, spread + spread.mean() * 0.05))
+
+    return StratifiedResults(cubes, turn_orders, strata)
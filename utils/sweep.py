@@ -0,0 +1,136 @@
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import sys
+from itertools import combinations
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
+import numpy as np
+from utils.batch import BatchCubieDerby
+from utils.cubes import CUBE_CLASSES, ENGINE_VERSION
+from utils.parallel import ProgressReporter
+from utils.results import RaceResults
+from utils.rng import derive_seed
+
+if TYPE_CHECKING:
+    # Annotations only, utils.solver imports this module
+    from utils.solver import ExactResults
+
+DEFAULT_CACHE_DIR = os.path.join('cache', 'sweep')
+
+
+class ResultCache:
+    """Race results on disk, one JSON file per entry named after the hash of its key.
+
+    The key holds everything that decides the outcome: lineup, pads, starting positions, number of races,
+    seed and the engine version. Entries are RaceResults unless get is told otherwise, the exact solver
+    keeps its ExactResults in one too (see ExactSolver.cache_key). Entries are written to a temporary file
+    first and renamed into place, so an interrupted sweep never leaves half-written entries behind.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(lineup: Tuple[str, ...], num_of_pads: int, starting_positions: dict | None,
+                 num_of_games: int, seed: int) -> dict:
+        return {'lineup': list(lineup),
+                'num_of_pads': num_of_pads,
+                'starting_positions': ({cube: list(starting_positions[cube]) for cube in lineup}
+                                       if starting_positions is not None else None),
+                'num_of_games': num_of_games,
+                'seed': seed,
+                'engine_version': ENGINE_VERSION}
+
+    def _path(self, key: dict) -> str:
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, f'{digest}.json')
+
+    def get(self, key: dict, results_type=RaceResults) -> 'RaceResults | ExactResults | None':
+        try:
+            with open(self._path(key), 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        if entry['key'] != key:
+            return None
+        return results_type.from_dict(entry['results'])
+
+    def put(self, key: dict, results: 'RaceResults | ExactResults'):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'results': results.to_dict()}, f)
+        os.replace(tmp_path, path)
+
+
+def all_lineups(num_of_cubes: int, cubes: Iterable[str] = None) -> List[Tuple[str, ...]]:
+    return list(combinations(cubes if cubes is not None else CUBE_CLASSES, num_of_cubes))
+
+
+def play_lineup(key: dict) -> Tuple[dict, RaceResults]:
+    lineup = key['lineup']
+    race = BatchCubieDerby(lineup, key['num_of_pads'], key['starting_positions'],
+                           rng=np.random.default_rng(derive_seed(key['seed'], *lineup)))
+    return key, race.play_games(key['num_of_games'])
+
+
+class LineupSweep:
+    """Evaluates many lineups on the same track, e.g. every 4 cube combination of `CUBE_CLASSES`.
+
+    Lineups already in the cache are returned straight away, only the missing ones are played,
+    one lineup per task across a process pool with the batch engine.
+    `layout` gives the starting [position, stack_order] of each lineup slot, all cubes start on pad 0 if None.
+    """
+
+    def __init__(self,
+                 num_of_pads: int,
+                 layout: List[List[int]] | None = None,
+                 num_of_games: int = 100_000,
+                 seed: int = 0,
+                 cache: ResultCache | None = None,
+                 processes: int | None = None):
+        self.num_of_pads = num_of_pads
+        self.layout = layout
+        self.num_of_games = num_of_games
+        self.seed = seed
+        self.cache = cache if cache is not None else ResultCache()
+        self.processes = processes if processes is not None else max(1, mp.cpu_count() - 1)
+
+    def starting_positions(self, lineup: Tuple[str, ...]) -> dict | None:
+        if self.layout is None:
+            return None
+        if len(self.layout) != len(lineup):
+            raise ValueError(f'Layout has {len(self.layout)} slots, lineup has {len(lineup)} cubes')
+        return {cube: list(position) for cube, position in zip(lineup, self.layout)}
+
+    def key(self, lineup: Tuple[str, ...]) -> dict:
+        return ResultCache.make_key(lineup, self.num_of_pads, self.starting_positions(lineup),
+                                    self.num_of_games, self.seed)
+
+    def run(self, lineups: Iterable[Tuple[str, ...]], show_progress: bool = True) -> Dict[tuple, RaceResults]:
+        results = {}
+        missing = []
+        for lineup in lineups:
+            lineup = tuple(lineup)
+            key = self.key(lineup)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[lineup] = cached
+            else:
+                missing.append(key)
+
+        if missing:
+            progress = ProgressReporter(len(missing) * self.num_of_games) if show_progress else None
+            with mp.Pool(processes=min(self.processes, len(missing))) as pool:
+                for key, lineup_results in pool.imap_unordered(play_lineup, missing):
+                    # Stored as soon as it arrives, an interrupted sweep keeps the lineups it finished
+                    self.cache.put(key, lineup_results)
+                    results[tuple(key['lineup'])] = lineup_results
+                    if progress is not None:
+                        progress.update(self.num_of_games)
+        elif show_progress:
+            sys.stderr.write(f'All {len(results)} lineups found in the cache\n')
+
+        return results
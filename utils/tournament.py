@@ -0,0 +1,107 @@
+from typing import Dict, List, Tuple
+import numpy as np
+from utils.batch import BatchCubieDerby
+from utils.game import STANDING_TO_POSITIONS
+from utils.rng import derive_seed
+from utils.solver import ExactSolver
+from utils.sweep import ResultCache
+
+
+class TournamentResults:
+    def __init__(self, cube_names: List[str], first_round: Dict[tuple, float],
+                 second_round: Dict[tuple, np.ndarray]):
+        self.cube_names = list(cube_names)
+        # First round finishing order -> probability
+        self.first_round = first_round
+        # First round finishing order -> placements[cube_idx, place] of the second round
+        self.second_round = second_round
+
+        num_of_cubes = len(self.cube_names)
+        self.placements = np.zeros((num_of_cubes, num_of_cubes))
+        for standings, p in first_round.items():
+            self.placements += p * second_round[standings]
+        self.placements /= sum(first_round.values())
+
+    @property
+    def wins(self) -> dict:
+        return {c: float(p) for c, p in zip(self.cube_names, self.placements[:, 0])}
+
+
+class Tournament:
+    """The two-round event: the first round's standings decide the second round's starting stacks.
+
+    Each second round starting layout is computed once and cached, then weighted by the probability of
+    the first round finishing order that leads to it.
+    Races are either simulated with the batch engine or solved exactly (4 cubes only, takes minutes per layout).
+    With solver_cache the solved layouts are kept on disk, so a second run doesn't solve them again.
+    """
+
+    def __init__(self,
+                 cubes: List[str],
+                 first_round_pads: int = 23,
+                 second_round_pads: int = 27,
+                 method: str = 'simulate',
+                 first_round_simulations: int = 1_000_000,
+                 second_round_simulations: int = 200_000,
+                 seed: int = 0,
+                 solver_cache: ResultCache | None = None):
+        if len(cubes) not in STANDING_TO_POSITIONS:
+            raise ValueError(f'No second round starting positions for {len(cubes)} cubes')
+        if method not in ('simulate', 'solve'):
+            raise ValueError(f'Unknown method: {method}')
+
+        self.cube_names = list(cubes)
+        self.first_round_pads = first_round_pads
+        self.second_round_pads = second_round_pads
+        self.method = method
+        self.first_round_simulations = first_round_simulations
+        self.second_round_simulations = second_round_simulations
+        self.seed = seed
+        self.solver_cache = solver_cache
+
+        self._first_round: Dict[tuple, float] | None = None
+        self._second_round_cache: Dict[tuple, np.ndarray] = {}
+        self._solvers: Dict[int, ExactSolver] = {}
+
+    def starting_positions(self, first_round_standings: Tuple[str, ...]) -> dict:
+        positions = STANDING_TO_POSITIONS[len(self.cube_names)]
+        return {cube: list(positions[place]) for place, cube in enumerate(first_round_standings)}
+
+    def first_round_distribution(self) -> Dict[tuple, float]:
+        if self._first_round is None:
+            if self.method == 'solve':
+                results = self._solver(self.first_round_pads).solve()
+                self._first_round = dict(results.standings_probabilities)
+            else:
+                race = BatchCubieDerby(self.cube_names, self.first_round_pads,
+                                       rng=np.random.default_rng(derive_seed(self.seed, 'first_round')))
+                results = race.play_games(self.first_round_simulations)
+                self._first_round = {standings: count / results.num_of_games
+                                     for standings, count in results.standings_counts.items()}
+        return self._first_round
+
+    def second_round_placements(self, first_round_standings: Tuple[str, ...]) -> np.ndarray:
+        # placements[cube_idx, place] of the second round, given how the first round finished
+        standings = tuple(first_round_standings)
+        if standings not in self._second_round_cache:
+            starting_positions = self.starting_positions(standings)
+            if self.method == 'solve':
+                results = self._solver(self.second_round_pads).solve(starting_positions)
+                placements = results.placements
+            else:
+                race = BatchCubieDerby(self.cube_names, self.second_round_pads, starting_positions,
+                                       rng=np.random.default_rng(derive_seed(self.seed, 'second_round', *standings)))
+                results = race.play_games(self.second_round_simulations)
+                placements = results.placements / results.num_of_games
+            self._second_round_cache[standings] = placements
+        return self._second_round_cache[standings]
+
+    def run(self) -> TournamentResults:
+        first_round = self.first_round_distribution()
+        second_round = {standings: self.second_round_placements(standings) for standings in first_round}
+        return TournamentResults(self.cube_names, first_round, second_round)
+
+    def _solver(self, num_of_pads: int) -> ExactSolver:
+        if num_of_pads not in self._solvers:
+            self._solvers[num_of_pads] = ExactSolver(self.cube_names, num_of_pads, self.solver_cache)
+        return self._solvers[num_of_pads]